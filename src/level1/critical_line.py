@@ -0,0 +1,151 @@
+import numpy as np
+
+from portfolio_utils import f_yield, f_volatility, FactorCovariance
+
+
+class CriticalLineFrontier:
+    """
+    Frontière efficiente exacte (long-only, totalement investie) par l'algorithme de la ligne critique.
+
+    On résout le QP paramétrique  min 1/2 w^T Sigma w - t mu^T w  s.c.  sum(w) = 1, w >= 0
+    pour t allant de +inf (rendement max) à 0 (variance min). Entre deux portefeuilles "coins",
+    les poids sont linéaires en t : la frontière est entièrement décrite par ses coins.
+    """
+
+    def __init__(self, mu, Sigma, tol: float = 1e-12):
+        self.mu = np.asarray(mu, dtype=float)
+        # L'algorithme extrait des sous-matrices Sigma[free, free] : une FactorCovariance est densifiée
+        self.Sigma = Sigma.to_dense() if isinstance(Sigma, FactorCovariance) else np.asarray(Sigma, dtype=float)
+        self.tol = tol
+
+        self.corner_lambdas, self.corner_weights = self._solve()
+        self.corner_yields = self.corner_weights @ self.mu
+        self.corner_volatility = np.sqrt(np.einsum('ij,ij->i', self.corner_weights @ self.Sigma,
+                                                   self.corner_weights))
+
+    def _solve(self) -> tuple[np.ndarray, np.ndarray]:
+        n = self.mu.shape[0]
+        free = [int(np.argmax(self.mu))]  # t = +inf : tout sur l'actif de rendement max
+        t = np.inf
+        last_changed = None
+
+        corner_lambdas = []
+        corner_weights = []
+
+        for _ in range(10 * n + 10):
+            a, b, g0, g1 = self._free_solution(free)
+
+            # Sortie : un actif libre atteint w_i = 0 quand t diminue
+            t_next, event = -1.0, None
+            if len(free) > 1:
+                for k, i in enumerate(free):
+                    if b[k] > self.tol and i != last_changed:
+                        t_i = -a[k] / b[k]
+                        if t_next < t_i <= t:
+                            t_next, event = t_i, ('out', i)
+
+            # Entrée : le multiplicateur de la borne w_j >= 0 s'annule
+            bounded = np.setdiff1d(np.arange(n), free)
+            if bounded.size:
+                Sigma_BF = self.Sigma[np.ix_(bounded, free)]
+                c = Sigma_BF @ a - g0
+                d = Sigma_BF @ b - self.mu[bounded] - g1
+                for j, c_j, d_j in zip(bounded, c, d):
+                    if d_j > self.tol and j != last_changed:
+                        t_j = -c_j / d_j
+                        if t_next < t_j <= t:
+                            t_next, event = t_j, ('in', j)
+
+            if event is None or t_next < 0:
+                corner_lambdas.append(0.0)
+                corner_weights.append(self._full_weights(free, a))
+                break
+
+            corner_lambdas.append(t_next)
+            corner_weights.append(self._full_weights(free, a + t_next * b))
+
+            kind, i = event
+            if kind == 'out':
+                free.remove(i)
+            else:
+                free.append(i)
+            t = t_next
+            last_changed = i
+
+        return np.array(corner_lambdas), np.array(corner_weights)
+
+    def _free_solution(self, free: list[int]) -> tuple[np.ndarray, np.ndarray, float, float]:
+        """Solution des KKT sur l'ensemble libre : w_F = a + t b, gamma = g0 + t g1."""
+        Sigma_FF = self.Sigma[np.ix_(free, free)]
+        mu_F = self.mu[free]
+        S1, Smu = np.linalg.solve(Sigma_FF, np.column_stack([np.ones(len(free)), mu_F])).T
+        A = S1.sum()
+        B = Smu.sum()
+        a = S1 / A
+        b = Smu - (B / A) * S1
+        return a, b, 1.0 / A, -B / A
+
+    def _full_weights(self, free: list[int], w_F: np.ndarray) -> np.ndarray:
+        w = np.zeros(self.mu.shape[0])
+        w[free] = np.clip(w_F, 0.0, None)
+        return w / w.sum()
+
+    def weights_at_return(self, target_return: float) -> np.ndarray:
+        """Portefeuille efficient de rendement donné, par interpolation entre deux coins (O(n))."""
+        r = self.corner_yields
+        if not r[-1] - 1e-12 <= target_return <= r[0] + 1e-12:
+            raise ValueError(f"Rendement {target_return} hors de la frontière efficiente [{r[-1]}, {r[0]}]")
+        if len(r) == 1:
+            return self.corner_weights[0].copy()
+
+        # Les rendements des coins sont décroissants
+        k = min(np.searchsorted(-r, -target_return, side='right') - 1, len(r) - 2)
+        k = max(k, 0)
+        span = r[k] - r[k + 1]
+        alpha = (target_return - r[k + 1]) / span if span > 0 else 1.0
+        alpha = np.clip(alpha, 0.0, 1.0)
+        return alpha * self.corner_weights[k] + (1 - alpha) * self.corner_weights[k + 1]
+
+    def weights_at_volatility(self, target_volatility: float) -> np.ndarray:
+        """Portefeuille efficient de volatilité donnée (une équation du second degré, O(n^2))."""
+        v = self.corner_volatility
+        if not v[-1] - 1e-12 <= target_volatility <= v[0] + 1e-12:
+            raise ValueError(f"Volatilité {target_volatility} hors de la frontière efficiente [{v[-1]}, {v[0]}]")
+        if len(v) == 1:
+            return self.corner_weights[0].copy()
+
+        k = min(np.searchsorted(-v, -target_volatility, side='right') - 1, len(v) - 2)
+        k = max(k, 0)
+        w_low = self.corner_weights[k + 1]
+        d = self.corner_weights[k] - w_low
+
+        # sigma^2(alpha) = qa alpha^2 + qb alpha + qc
+        Sigma_d = self.Sigma @ d
+        qa = np.dot(d, Sigma_d)
+        qb = 2 * np.dot(w_low, Sigma_d)
+        qc = np.dot(w_low, self.Sigma @ w_low) - target_volatility ** 2
+        if qa <= 1e-18:
+            alpha = -qc / qb if abs(qb) > 1e-18 else 1.0
+        else:
+            alpha = (-qb + np.sqrt(max(qb ** 2 - 4 * qa * qc, 0.0))) / (2 * qa)
+        alpha = np.clip(alpha, 0.0, 1.0)
+        return w_low + alpha * d
+
+    def min_volatility_for_return(self, r_min: float) -> np.ndarray | None:
+        """Portefeuille de volatilité minimale parmi ceux de rendement >= r_min (None si aucun)."""
+        if r_min > self.corner_yields[0]:
+            return None
+        if r_min <= self.corner_yields[-1]:
+            return self.corner_weights[-1].copy()
+        return self.weights_at_return(r_min)
+
+    def frontier(self, num_points: int = 50) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+        """Échantillonne la frontière (coins inclus) au format de optimize_portfolio."""
+        targets = np.linspace(self.corner_yields[-1], self.corner_yields[0], num_points)
+        targets = np.unique(np.concatenate([targets, self.corner_yields]))
+
+        frontier_weights = [self.weights_at_return(r) for r in targets]
+        frontier_yields = np.array([f_yield(w, self.mu) for w in frontier_weights])
+        frontier_volatility = np.array([f_volatility(w, self.Sigma) for w in frontier_weights])
+
+        return frontier_yields, frontier_volatility, frontier_weights
@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-from scipy.optimize import minimize
+from scipy.optimize import minimize, Bounds, LinearConstraint
 
 from portfolio_utils import *
 
@@ -11,9 +11,36 @@ def f_objective(w, lambda_param, mu, Sigma):
     return lambda_param * portfolio_variance - (1 - lambda_param) * portfolio_yield
 
 
-def optimize_portfolio(lambdas, mu: np.ndarray, Sigma: np.ndarray) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+def f_objective_grad(w, lambda_param, mu, Sigma):
+    """Gradient analytique de f_objective : lambda * Sigma w / sigma(w) - (1 - lambda) * mu."""
+    Sigma_w = Sigma @ w
+    portfolio_volatility = max(np.sqrt(np.dot(w, Sigma_w)), 1e-12)
+    return lambda_param * Sigma_w / portfolio_volatility - (1 - lambda_param) * mu
+
+
+def f_objective_hessp(w, p, lambda_param, mu, Sigma):
+    """Produit Hessienne-vecteur de f_objective (utilisé par les méthodes de type trust-region)."""
+    Sigma_w = Sigma @ w
+    portfolio_volatility = max(np.sqrt(np.dot(w, Sigma_w)), 1e-12)
+    Sigma_p = Sigma @ p
+    return lambda_param * (Sigma_p / portfolio_volatility
+                           - Sigma_w * np.dot(Sigma_w, p) / portfolio_volatility ** 3)
+
+
+def optimize_portfolio(lambdas, mu: np.ndarray, Sigma: np.ndarray, sweep: bool = False,
+                       method: str = 'SLSQP') -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+    """
+    Frontière efficiente par balayage de lambda.
+
+    En mode sweep, les gradients analytiques (et le produit Hessienne-vecteur pour 'trust-constr')
+    sont fournis au solveur et chaque lambda part de l'optimum du lambda précédent.
+    """
     num_assets = len(mu)
 
+    if sweep:
+        return _optimize_portfolio_sweep(lambdas, np.asarray(mu, dtype=float), as_covariance(Sigma),
+                                         method)
+
     # Contraintes
     constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1})  # Sum w_i = 1
     bounds = tuple((0, 1) for _ in range(num_assets))  # w_i entre 0 et 1
@@ -41,4 +68,138 @@ def optimize_portfolio(lambdas, mu: np.ndarray, Sigma: np.ndarray) -> tuple[np.n
     frontier_yields = np.array(frontier_yields)
     frontier_volatility = np.array(frontier_volatility)
 
-    return frontier_yields, frontier_volatility, frontier_weights
\ No newline at end of file
+    return frontier_yields, frontier_volatility, frontier_weights
+
+
+def _optimize_portfolio_sweep(lambdas, mu: np.ndarray, Sigma: np.ndarray,
+                              method: str) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+    num_assets = len(mu)
+
+    if method == 'trust-constr':
+        constraints = LinearConstraint(np.ones((1, num_assets)), 1, 1)
+        bounds = Bounds(np.zeros(num_assets), np.ones(num_assets))
+        hessp = f_objective_hessp
+    else:
+        ones = np.ones(num_assets)
+        constraints = ({'type': 'eq', 'fun': lambda w: np.sum(w) - 1, 'jac': lambda w: ones})
+        bounds = tuple((0, 1) for _ in range(num_assets))
+        hessp = None
+
+    # Point de départ du premier lambda, puis démarrage à chaud sur l'optimum précédent
+    current_guess = np.array(num_assets * [1. / num_assets])
+
+    frontier_yields = []
+    frontier_volatility = []
+    frontier_weights = []
+
+    for lambda_param in lambdas:
+        result = minimize(f_objective, current_guess, args=(lambda_param, mu, Sigma), method=method,
+                          jac=f_objective_grad, hessp=hessp, bounds=bounds, constraints=constraints)
+        if result.success:
+            w_opt = result.x
+            frontier_yields.append(f_yield(w_opt, mu))
+            frontier_volatility.append(f_volatility(w_opt, Sigma))
+            frontier_weights.append(w_opt)
+            current_guess = w_opt
+        else:
+            print(f"Optimization failed for lambda={lambda_param}")
+
+    return np.array(frontier_yields), np.array(frontier_volatility), frontier_weights
+
+
+def project_simplex_rows(V: np.ndarray) -> np.ndarray:
+    """Projection euclidienne de chaque ligne de V sur le simplexe {w >= 0, sum(w) = 1}."""
+    m, n = V.shape
+    U = -np.sort(-V, axis=1)
+    css = np.cumsum(U, axis=1) - 1
+    cond = U - css / np.arange(1, n + 1) > 0
+    rho = n - np.argmax(cond[:, ::-1], axis=1)  # nombre de composantes actives
+    theta = css[np.arange(m), rho - 1] / rho
+    return np.maximum(V - theta[:, None], 0)
+
+
+def _objective_rows(W, W_Sigma, lambdas, mu):
+    volatility = np.sqrt(np.maximum(np.einsum('ij,ij->i', W_Sigma, W), 1e-24))
+    return lambdas * volatility - (1 - lambdas) * (W @ mu), volatility
+
+
+def optimize_portfolio_batched(lambdas, mu: np.ndarray, Sigma: np.ndarray, tol: float = 1e-7, max_iter: int = 5000,
+                               return_report: bool = False):
+    """
+    Frontière efficiente calculée pour tous les lambdas simultanément.
+
+    Gradient projeté accéléré (FISTA avec redémarrage et pas par ligne) sur la matrice des poids (L x n) :
+    chaque itération coûte un produit W @ Sigma. Un lambda est convergé quand la norme de son gradient
+    projeté est inférieure à tol. Avec return_report=True, un dictionnaire de convergence est aussi renvoyé.
+    """
+    lambdas = np.asarray(lambdas, dtype=float)
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+    num_lambdas, num_assets = lambdas.shape[0], mu.shape[0]
+
+    W = np.full((num_lambdas, num_assets), 1. / num_assets)
+    W_Sigma = W @ Sigma
+    f_W, volatility = _objective_rows(W, W_Sigma, lambdas, mu)
+    Y, Y_Sigma = W.copy(), W_Sigma.copy()
+    momentum = np.ones(num_lambdas)
+
+    # Constante de Lipschitz locale de lambda * sigma(w), ajustée ensuite par recherche linéaire
+    norm_Sigma = Sigma.norm2() if isinstance(Sigma, FactorCovariance) else np.linalg.norm(Sigma, 2)
+    step_L = np.maximum(lambdas * norm_Sigma / volatility, 1e-8)
+
+    converged = np.zeros(num_lambdas, dtype=bool)
+    residual = np.full(num_lambdas, np.inf)
+    n_iter = np.zeros(num_lambdas, dtype=int)
+
+    for _ in range(max_iter):
+        active = np.flatnonzero(~converged)
+        if active.size == 0:
+            break
+        n_iter[active] += 1
+
+        lam, Ya, Ya_Sigma = lambdas[active], Y[active], Y_Sigma[active]
+        f_Y, vol_Y = _objective_rows(Ya, Ya_Sigma, lam, mu)
+        grad = lam[:, None] * Ya_Sigma / vol_Y[:, None] - (1 - lam)[:, None] * mu
+
+        # Pas de gradient projeté avec recherche linéaire (seules les lignes refusées sont recalculées)
+        Z = np.empty_like(Ya)
+        Z_Sigma = np.empty_like(Ya)
+        f_Z = np.empty(active.size)
+        pending = np.arange(active.size)
+        while pending.size:
+            L_p = step_L[active[pending]]
+            Z_p = project_simplex_rows(Ya[pending] - grad[pending] / L_p[:, None])
+            Z_Sigma_p = Z_p @ Sigma
+            f_Z_p, _ = _objective_rows(Z_p, Z_Sigma_p, lam[pending], mu)
+            D = Z_p - Ya[pending]
+            bound = f_Y[pending] + np.einsum('ij,ij->i', grad[pending], D) + 0.5 * L_p * np.einsum('ij,ij->i', D, D)
+            ok = f_Z_p <= bound + 1e-15 * np.abs(bound)
+            Z[pending[ok]], Z_Sigma[pending[ok]], f_Z[pending[ok]] = Z_p[ok], Z_Sigma_p[ok], f_Z_p[ok]
+            step_L[active[pending[~ok]]] *= 2
+            pending = pending[~ok]
+
+        residual[active] = step_L[active] * np.linalg.norm(Z - Ya, axis=1)
+
+        # Redémarrage adaptatif quand l'objectif remonte, sinon extrapolation de Nesterov
+        restart = f_Z > f_W[active]
+        momentum_new = (1 + np.sqrt(1 + 4 * momentum[active] ** 2)) / 2
+        beta = np.where(restart, 0.0, (momentum[active] - 1) / momentum_new)
+        momentum[active] = np.where(restart, 1.0, momentum_new)
+
+        Y[active] = Z + beta[:, None] * (Z - W[active])
+        Y_Sigma[active] = Z_Sigma + beta[:, None] * (Z_Sigma - W_Sigma[active])
+        W[active], W_Sigma[active], f_W[active] = Z, Z_Sigma, f_Z
+
+        converged[active] = residual[active] <= tol
+
+    for lambda_param in lambdas[~converged]:
+        print(f"Optimization did not converge for lambda={lambda_param}")
+
+    frontier_yields = W @ mu
+    frontier_volatility = np.sqrt(np.maximum(np.einsum('ij,ij->i', W_Sigma, W), 0))
+    frontier_weights = list(W)
+
+    if return_report:
+        report = {'converged': converged, 'n_iter': n_iter, 'residual': residual}
+        return frontier_yields, frontier_volatility, frontier_weights, report
+    return frontier_yields, frontier_volatility, frontier_weights
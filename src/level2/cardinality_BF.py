@@ -1,35 +1,230 @@
-from concurrent.futures import ProcessPoolExecutor
-from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import combinations, islice
 from tqdm import tqdm
 import math
 import pandas as pd
 
 from portfolio_utils import *
 from level1.functions import optimize_portfolio
+from result_cache import cached, fingerprint
 
-# ---- Variables globales pour partager df/lambdas sans les pickliser 1000 fois ---- #
-df_global = None
+# ---- Variables globales pour partager mu/Sigma/lambdas sans les pickliser 1000 fois ---- #
+mu_global = None
+Sigma_global = None
 lambdas_global = None
+solver_global = "slsqp"
+shm_global = None  # garde les segments de mémoire partagée ouverts dans le worker
 
-def init_worker(df, lambdas):
-    global df_global, lambdas_global
-    df_global = df
+# Taille des paquets de sous-ensembles résolus ensemble par le solveur vectorisé
+BATCH_SIZE = 4096
+
+def init_worker(mu_spec, Sigma_spec, lambdas, solver="slsqp"):
+    global mu_global, Sigma_global, lambdas_global, solver_global, shm_global
+    mu_shm, mu_global = attach_array(mu_spec)
+    Sigma_shm, Sigma_global = attach_array(Sigma_spec)
+    shm_global = (mu_shm, Sigma_shm)
     lambdas_global = lambdas
+    solver_global = solver
 
 def worker(possibility):
-    df = df_global
-    lambdas = lambdas_global
+    idx = list(possibility)
+
+    # Sous-problème K x K extrait des moments complets, sans repasser par pandas
+    mu = mu_global[idx]
+    Sigma = Sigma_global[np.ix_(idx, idx)]
+
+    return optimize_portfolio(lambdas_global, mu, Sigma)
+
+def optimize_subsets_batched(lambdas, mu_stack: np.ndarray, Sigma_stack: np.ndarray,
+                             tol: float = 1e-10) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Résout min lambda * sigma(w) - (1 - lambda) * mu^T w sur le simplexe pour B petits sous-ensembles
+    (mu_stack : (B, K), Sigma_stack : (B, K, K)) et tous les lambdas à la fois.
+
+    Énumération des supports : sur un support S, l'optimum sans contrainte de signe a une forme fermée
+    (il est sur la frontière de Markowitz de S), obtenue par un np.linalg.solve batché. L'optimum global
+    est le meilleur candidat réalisable (w >= 0). Coût en 2^K : réservé aux petits K.
+    Renvoie rendements (B, L), volatilités (B, L) et poids (B, L, K).
+    """
+    lambdas = np.asarray(lambdas, dtype=float)
+    num_subsets, K = mu_stack.shape
+
+    # Supports à un seul actif : toujours réalisables
+    variances = np.diagonal(Sigma_stack, axis1=1, axis2=2)
+    objective = lambdas[None, :, None] * np.sqrt(variances)[:, None, :] - (1 - lambdas)[None, :, None] * mu_stack[:, None, :]
+    best = np.argmin(objective, axis=2)
+    best_objective = np.take_along_axis(objective, best[..., None], axis=2)[..., 0]
+    weights = np.zeros((num_subsets, len(lambdas), K))
+    np.put_along_axis(weights, best[..., None], 1.0, axis=2)
+
+    for size in range(2, K + 1):
+        for support in combinations(range(K), size):
+            support = list(support)
+            Sigma_S = Sigma_stack[:, support][:, :, support]
+            mu_S = mu_stack[:, support]
+
+            X = _solve_stack(Sigma_S, np.stack([np.ones_like(mu_S), mu_S], axis=2))
+            S1, Smu = X[..., 0], X[..., 1]
+            A = S1.sum(axis=1)
+            B = Smu.sum(axis=1)
+            D = np.maximum(A * np.einsum('bi,bi->b', mu_S, Smu) - B ** 2, 0.0)
+
+            # Optimum borné sur le support ssi lambda^2 A > (1 - lambda)^2 D
+            denom2 = lambdas[None, :] ** 2 * A[:, None] - (1 - lambdas)[None, :] ** 2 * D[:, None]
+            bounded = denom2 > tol * A[:, None]
+            scale = np.where(bounded, (1 - lambdas)[None, :] / (A[:, None] * np.sqrt(np.where(bounded, denom2, 1.0))), 0.0)
+            direction = A[:, None] * Smu - B[:, None] * S1
+            w_S = (S1 / A[:, None])[:, None, :] + scale[..., None] * direction[:, None, :]
+
+            feasible = bounded & np.all(w_S >= -1e-12, axis=2)
+            if not feasible.any():
+                continue
+
+            w_S = np.maximum(w_S, 0.0)
+            w_S /= w_S.sum(axis=2, keepdims=True)
+            volatility = np.sqrt(np.maximum(np.einsum('bls,bst,blt->bl', w_S, Sigma_S, w_S), 0.0))
+            candidate = lambdas[None, :] * volatility - (1 - lambdas)[None, :] * np.einsum('bls,bs->bl', w_S, mu_S)
+
+            better = feasible & (candidate < best_objective - 1e-15)
+            if better.any():
+                best_objective = np.where(better, candidate, best_objective)
+                w_full = np.zeros_like(weights)
+                w_full[..., support] = w_S
+                weights = np.where(better[..., None], w_full, weights)
+
+    frontier_yields = np.einsum('blk,bk->bl', weights, mu_stack)
+    frontier_volatility = np.sqrt(np.maximum(np.einsum('blk,bkj,blj->bl', weights, Sigma_stack, weights), 0.0))
+    return frontier_yields, frontier_volatility, weights
+
+def _solve_stack(A, b):
+    try:
+        return np.linalg.solve(A, b)
+    except np.linalg.LinAlgError:
+        # Sous-matrice singulière (actifs parfaitement corrélés) : pseudo-inverse
+        return np.linalg.pinv(A) @ b
 
-    selected_columns = df.columns[list(possibility)]
-    temp_df = df[selected_columns]
+def worker_block(start, stop, number_of_shares):
+    """Résout d'un coup (solveur vectorisé) tous les sous-ensembles de rang [start, stop)."""
+    num_assets = mu_global.shape[0]
+    idx = np.array(list(combinations_range(num_assets, number_of_shares, start, stop)), dtype=int)
+    mu_stack = mu_global[idx]
+    Sigma_stack = Sigma_global[idx[:, :, None], idx[:, None, :]]
+    return (idx,) + optimize_subsets_batched(lambdas_global, mu_stack, Sigma_stack)
 
-    returns = f_returns_on_df(temp_df)
-    mu = f_mu_on_df(returns)
-    Sigma = f_sigma_on_df(returns)
+def pareto_merge(yields, volatility, weights):
+    """Réduit un ensemble de points (rendement, volatilité, poids) à ses points non dominés."""
+    keep = non_dominated_indices(yields, volatility)
+    return yields[keep], volatility[keep], weights[keep]
 
-    return optimize_portfolio(lambdas, mu, Sigma)
+# ---- Rang lexicographique des combinaisons (découpage en plages [start, stop)) ---- #
 
-def optimize(df: pd.DataFrame, number_of_shares: int, lambdas: np.ndarray, max_workers: int = 8):
+def combination_rank(combination, n: int) -> int:
+    """Rang lexicographique d'une combinaison triée de range(n)."""
+    k = len(combination)
+    rank = 0
+    previous = -1
+    for i, c in enumerate(combination):
+        for j in range(previous + 1, c):
+            rank += math.comb(n - 1 - j, k - 1 - i)
+        previous = c
+    return rank
+
+def combination_unrank(rank: int, n: int, k: int) -> tuple:
+    """Combinaison de range(n) de taille k de rang lexicographique donné."""
+    combination = []
+    j = 0
+    for i in range(k):
+        while True:
+            count = math.comb(n - 1 - j, k - 1 - i)
+            if rank < count:
+                break
+            rank -= count
+            j += 1
+        combination.append(j)
+        j += 1
+    return tuple(combination)
+
+def combinations_range(n: int, k: int, start: int, stop: int):
+    """Itère sur les combinaisons de rang dans [start, stop), dans l'ordre de itertools.combinations."""
+    if start >= stop:
+        return
+    combination = list(combination_unrank(start, n, k))
+    for _ in range(stop - start):
+        yield tuple(combination)
+        # Successeur lexicographique
+        i = k - 1
+        while i >= 0 and combination[i] == n - k + i:
+            i -= 1
+        if i < 0:
+            return
+        combination[i] += 1
+        for j in range(i + 1, k):
+            combination[j] = combination[j - 1] + 1
+
+def shard_ranges(total: int, num_shards: int) -> list[tuple[int, int]]:
+    """Découpe [0, total) en num_shards plages contiguës de tailles équilibrées."""
+    bounds = [total * i // num_shards for i in range(num_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def worker_range(start, stop, number_of_shares):
+    """
+    Optimise les sous-ensembles de rang [start, stop) en ne gardant que l'ensemble non dominé courant.
+    Les poids sont renvoyés sur tous les actifs (taille n).
+    """
+    num_assets = mu_global.shape[0]
+    front = (np.empty(0), np.empty(0), np.empty((0, num_assets)))
+    buffer = []
+
+    if solver_global == "batched":
+        for block_start in range(start, stop, BATCH_SIZE):
+            idx, fr, fv, fw = worker_block(block_start, min(block_start + BATCH_SIZE, stop), number_of_shares)
+            num_subsets, num_lambdas = fr.shape
+            full_weights = np.zeros((num_subsets, num_lambdas, num_assets))
+            np.put_along_axis(full_weights, np.broadcast_to(idx[:, None, :], fw.shape), fw, axis=2)
+            front = _reduce(front, [(fr.ravel(), fv.ravel(), full_weights.reshape(-1, num_assets))])
+        return front
+
+    for possibility in combinations_range(num_assets, number_of_shares, start, stop):
+        idx = list(possibility)
+        fr, fv, fw = worker(possibility)
+        if len(fw) == 0:
+            continue
+        full_weights = np.zeros((len(fw), num_assets))
+        full_weights[:, idx] = fw
+        buffer.append((fr, fv, full_weights))
+
+        # Réduction régulière pour borner la mémoire du worker
+        if len(buffer) >= 64:
+            front = _reduce(front, buffer)
+            buffer = []
+
+    return _reduce(front, buffer)
+
+def _reduce(front, buffer):
+    if not buffer:
+        return front
+    yields = np.concatenate([front[0]] + [b[0] for b in buffer])
+    volatility = np.concatenate([front[1]] + [b[1] for b in buffer])
+    weights = np.concatenate([front[2]] + [b[2] for b in buffer])
+    return pareto_merge(yields, volatility, weights)
+
+@cached(ignore=("max_workers", "chunk_size"))
+def optimize(df: pd.DataFrame, number_of_shares: int, lambdas: np.ndarray, max_workers: int = 8,
+             stream: bool = False, chunk_size: int = 1000, solver: str = "slsqp"):
+    """
+    Énumère toutes les combinaisons de number_of_shares actifs et optimise chacune sur la grille lambdas.
+
+    solver="slsqp" résout chaque sous-ensemble avec optimize_portfolio ; solver="batched" résout des
+    paquets de sous-ensembles d'un coup avec optimize_subsets_batched (K <= 5 recommandé).
+
+    Par défaut, renvoie les frontières de chaque sous-ensemble (listes, poids sur les K actifs).
+    Avec stream=True, chaque worker réduit ses résultats au front de Pareto au fil de l'eau et le
+    processus parent fusionne ces fronts : seul le front final (poids sur les n actifs) est renvoyé,
+    et la mémoire reste bornée par sa taille.
+    """
+    if stream:
+        return optimize_range(df, number_of_shares, lambdas, max_workers=max_workers, chunk_size=chunk_size,
+                              solver=solver)
 
     num_assets = df.shape[1]
     possibilities = combinations(range(num_assets), number_of_shares)
@@ -37,23 +232,204 @@ def optimize(df: pd.DataFrame, number_of_shares: int, lambdas: np.ndarray, max_w
     # Nombre total de combinaisons (pour tqdm)
     total = math.comb(num_assets, number_of_shares)
 
+    # mu/Sigma calculés une seule fois puis partagés avec les workers
+    returns = f_returns_on_df(df)
+    mu_shm, mu_spec = share_array(f_mu_on_df(returns).values)
+    Sigma_shm, Sigma_spec = share_array(f_sigma_on_df(returns).values)
+
     frontier_yields = []
     frontier_volatility = []
     frontier_weights = []
 
-    with ProcessPoolExecutor(
-        max_workers=max_workers,
-        initializer=init_worker,
-        initargs=(df, lambdas)
-    ) as executor:
-
-        for fr, fv, fw in tqdm(
-            executor.map(worker, possibilities, chunksize=10),
-            total=total,
-            desc="Optimizing"
-        ):
-            frontier_yields.append(fr)
-            frontier_volatility.append(fv)
-            frontier_weights.append(fw)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(mu_spec, Sigma_spec, lambdas, solver)
+        ) as executor:
+
+            if solver == "batched":
+                blocks = [(b, min(b + BATCH_SIZE, total)) for b in range(0, total, BATCH_SIZE)]
+                with tqdm(total=total, desc="Optimizing") as progress:
+                    for _, fr, fv, fw in executor.map(worker_block, *zip(*blocks),
+                                                      [number_of_shares] * len(blocks)):
+                        frontier_yields.extend(fr)
+                        frontier_volatility.extend(fv)
+                        frontier_weights.extend(list(w) for w in fw)
+                        progress.update(len(fr))
+                return frontier_yields, frontier_volatility, frontier_weights
+
+            for fr, fv, fw in tqdm(
+                executor.map(worker, possibilities, chunksize=10),
+                total=total,
+                desc="Optimizing"
+            ):
+                frontier_yields.append(fr)
+                frontier_volatility.append(fv)
+                frontier_weights.append(fw)
+    finally:
+        for shm in (mu_shm, Sigma_shm):
+            shm.close()
+            shm.unlink()
 
     return frontier_yields, frontier_volatility, frontier_weights
+
+def optimize_range(df: pd.DataFrame, number_of_shares: int, lambdas: np.ndarray, start: int = 0, stop: int = None,
+                   checkpoint_path: str = None, checkpoint_every: int = 100_000, max_workers: int = 8,
+                   chunk_size: int = 1000, solver: str = "slsqp"):
+    """
+    Front de Pareto des combinaisons de rang [start, stop) (toutes par défaut).
+
+    Avec checkpoint_path, le front partiel et le prochain rang à traiter sont sauvegardés tous les
+    checkpoint_every rangs ; relancer la même commande reprend là où le calcul s'était arrêté. Le
+    checkpoint enregistre une empreinte de mu, Sigma et du solveur : après une mise à jour des données,
+    il est refusé (ValueError) au lieu de renvoyer un front périmé.
+    Les fichiers de plusieurs plages se combinent avec merge_shards.
+    """
+    num_assets = df.shape[1]
+    total = math.comb(num_assets, number_of_shares)
+    stop = total if stop is None else min(stop, total)
+    lambdas = np.asarray(lambdas, dtype=float)
+
+    returns = f_returns_on_df(df)
+    mu = f_mu_on_df(returns).values
+    Sigma = f_sigma_on_df(returns).values
+    data_key = fingerprint(mu, Sigma, solver)
+
+    front = (np.empty(0), np.empty(0), np.empty((0, num_assets)))
+    next_rank = start
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        next_rank, front = load_checkpoint(checkpoint_path, num_assets, number_of_shares, start, stop, lambdas,
+                                           data_key)
+
+    if next_rank >= stop:
+        return front
+
+    mu_shm, mu_spec = share_array(mu)
+    Sigma_shm, Sigma_spec = share_array(Sigma)
+
+    if checkpoint_path is None:
+        checkpoint_every = stop - start
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_worker,
+            initargs=(mu_spec, Sigma_spec, lambdas, solver)
+        ) as executor, tqdm(total=stop - start, initial=next_rank - start, desc="Optimizing") as progress:
+
+            while next_rank < stop:
+                block_stop = min(next_rank + checkpoint_every, stop)
+
+                # Nombre borné de paquets en vol pour ne pas matérialiser toute l'énumération
+                chunks = iter(range(next_rank, block_stop, chunk_size))
+                pending = {}
+                while True:
+                    for chunk_start in islice(chunks, 2 * max_workers - len(pending)):
+                        chunk_stop = min(chunk_start + chunk_size, block_stop)
+                        future = executor.submit(worker_range, chunk_start, chunk_stop, number_of_shares)
+                        pending[future] = chunk_stop - chunk_start
+                    if not pending:
+                        break
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        progress.update(pending.pop(future))
+                        front = _reduce(front, [future.result()])
+
+                next_rank = block_stop
+                if checkpoint_path is not None:
+                    save_checkpoint(checkpoint_path, num_assets, number_of_shares, start, stop, next_rank, lambdas,
+                                    front, data_key)
+    finally:
+        for shm in (mu_shm, Sigma_shm):
+            shm.close()
+            shm.unlink()
+
+    return front
+
+def save_checkpoint(path, num_assets, number_of_shares, start, stop, next_rank, lambdas, front, data_key=""):
+    """Écriture atomique (fichier temporaire propre au processus puis renommage) du front partiel d'une plage."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, num_assets=num_assets, number_of_shares=number_of_shares, start=start, stop=stop,
+                 next_rank=next_rank, lambdas=lambdas, data_key=data_key, yields=front[0], volatility=front[1],
+                 weights=front[2])
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path, num_assets, number_of_shares, start, stop, lambdas, data_key=""):
+    with np.load(path) as data:
+        expected = (num_assets, number_of_shares, start, stop)
+        found = tuple(int(data[key]) for key in ("num_assets", "number_of_shares", "start", "stop"))
+        if found != expected or not np.array_equal(data["lambdas"], lambdas):
+            raise ValueError(f"Checkpoint {path} ne correspond pas à ce calcul ({found} != {expected})")
+        if "data_key" not in data or str(data["data_key"]) != data_key:
+            raise ValueError(f"Checkpoint {path} calculé sur d'autres données (mu, Sigma) ou avec un autre solveur")
+        return int(data["next_rank"]), (data["yields"], data["volatility"], data["weights"])
+
+def merge_shards(paths) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fusionne les fronts de plusieurs plages (fichiers de checkpoint) en un seul front de Pareto.
+    Les plages doivent être complètes, calculées sur le même problème (nombre d'actifs, K, lambdas,
+    données et solveur) et couvrir exactement [0, C(n, K)) ; sinon ValueError.
+    """
+    shards = []
+    for path in paths:
+        with np.load(path) as data:
+            shards.append({
+                'path': path,
+                'problem': (int(data["num_assets"]), int(data["number_of_shares"]),
+                            str(data["data_key"]) if "data_key" in data else ""),
+                'lambdas': data["lambdas"],
+                'range': (int(data["start"]), int(data["stop"])),
+                'next_rank': int(data["next_rank"]),
+                'front': (data["yields"], data["volatility"], data["weights"]),
+            })
+    if not shards:
+        raise ValueError("Aucune plage à fusionner")
+
+    reference = shards[0]
+    for shard in shards:
+        if shard['problem'] != reference['problem'] or not np.array_equal(shard['lambdas'], reference['lambdas']):
+            raise ValueError(f"{shard['path']} ne porte pas sur le même problème que {reference['path']}")
+        if shard['next_rank'] < shard['range'][1]:
+            raise ValueError(f"Plage incomplète dans {shard['path']} ({shard['next_rank']}/{shard['range'][1]})")
+
+    num_assets, number_of_shares, _ = reference['problem']
+    covered = 0
+    for shard in sorted(shards, key=lambda shard: shard['range']):
+        start, stop = shard['range']
+        if start != covered:
+            raise ValueError(f"Plages non contiguës : {shard['path']} commence à {start}, attendu {covered}")
+        covered = stop
+    total = math.comb(num_assets, number_of_shares)
+    if covered != total:
+        raise ValueError(f"Les plages couvrent [0, {covered}) au lieu de [0, {total})")
+
+    return _reduce(shards[0]['front'], [shard['front'] for shard in shards[1:]])
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Énumération brute-force de la frontière à cardinalité fixe")
+    parser.add_argument("--shares", type=int, default=2, help="Nombre d'actifs K")
+    parser.add_argument("--lambdas", type=int, default=40, help="Nombre de lambdas (linspace)")
+    parser.add_argument("--shard", type=int, default=0, help="Indice de la plage à calculer")
+    parser.add_argument("--num-shards", type=int, default=1, help="Nombre total de plages")
+    parser.add_argument("--checkpoint", help="Fichier de checkpoint de la plage (défaut : frontier_BF_shard_<shard>.npz)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--solver", choices=["slsqp", "batched"], default="slsqp")
+    parser.add_argument("--merge", nargs="+", help="Fusionne des fichiers de plages au lieu de calculer")
+    args = parser.parse_args()
+
+    if args.merge:
+        frontier_yields, frontier_volatility, frontier_weights = merge_shards(args.merge)
+    else:
+        df = load_datas()
+        total = math.comb(df.shape[1], args.shares)
+        start, stop = shard_ranges(total, args.num_shards)[args.shard]
+        frontier_yields, frontier_volatility, frontier_weights = optimize_range(
+            df, args.shares, np.linspace(0, 1, args.lambdas), start=start, stop=stop,
+            checkpoint_path=args.checkpoint or f"frontier_BF_shard_{args.shard}.npz", max_workers=args.workers, solver=args.solver)
+
+    print(f"{len(frontier_yields)} portefeuilles non dominés")
@@ -1,11 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
 import cvxpy as cp
 import numpy as np
+import pandas as pd
+
+from portfolio_utils import f_yield, f_volatility, as_covariance, covariance_diag
+from level2.functions import nb_not_null_weights, adaptive_epsilons, risk_expression
+
+def build_problem(mu: np.ndarray, Sigma: np.ndarray, factor: bool = False):
+    """
+    Construit une seule fois le problème (DPP) avec epsilon et lambda_penalty en cp.Parameter.
+    Avec factor=True, le risque s'écrit ||L^T w||^2 <= epsilon (Cholesky de Sigma) au lieu de quad_form ;
+    Sigma peut aussi être une FactorCovariance (voir level2.functions.risk_expression).
+    Renvoie (problem, w, eps, lambda_penalty).
+    """
+    n = mu.shape[0]
 
-from portfolio_utils import f_yield, f_volatility
-from level2.functions import nb_not_null_weights
+    w = cp.Variable(n)
+    eps = cp.Parameter(nonneg=True)
+    lambda_penalty = cp.Parameter(nonneg=True)
 
-def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray, lambda_penalty: float) -> tuple[list[float], list[float], list[np.ndarray]]:
-    n = mu.shape[0]
+    risk = risk_expression(w, Sigma, factor=factor)
+
+    # Objectif : maximise le rendement avec pénalisation L1 pour sparsité
+    objective = cp.Minimize(-mu @ w + lambda_penalty * cp.sum(w))
+
+    constraints = [
+        cp.sum(w) == 1,
+        w >= 0,
+        risk <= eps
+    ]
+
+    return cp.Problem(objective, constraints), w, eps, lambda_penalty
+
+def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray, lambda_penalty: float, factor: bool = False) -> tuple[list[float], list[float], list[np.ndarray]]:
+
+    # Problème compilé une fois, résolu pour chaque epsilon avec démarrage à chaud
+    problem, w, eps_param, penalty_param = build_problem(mu, Sigma, factor=factor)
+    penalty_param.value = lambda_penalty
 
     # ----------------------------
     # Résultats
@@ -16,42 +47,128 @@ def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray, l
     # Boucle ε-contrainte
     # ----------------------------
     for eps in epsilons:
-
-        w = cp.Variable(n)
-
-        # Objectif : maximise le rendement avec pénalisation L1 pour sparsité
-        objective = cp.Minimize(-mu @ w + lambda_penalty * cp.sum(w))
-
-        constraints = [
-            cp.sum(w) == 1,
-            w >= 0,
-            cp.quad_form(w, Sigma) <= eps
-        ]
-
-        problem = cp.Problem(objective, constraints)
-        problem.solve(solver=cp.SCS, verbose=False)
-
-        if problem.status not in ["optimal", "optimal_inaccurate"]:
+        w_sparse = solve_point(problem, w, eps_param, eps, K)
+        if w_sparse is None:
             print(f"Aucune solution pour eps = {eps}")
             continue
 
-        w_val = w.value
-
-        # ----------------------------
-        # Post-traitement : sélectionner les K plus gros actifs
-        # ----------------------------
-        top_indices = np.argsort(-w_val)[:K]  # indices des K plus gros
-        w_sparse = np.zeros_like(w_val)
-        w_sparse[top_indices] = w_val[top_indices]
-        w_sparse /= w_sparse.sum()  # renormaliser pour que sum=1
-
         # Stockage des résultats
 
         frontier_weights.append(w_sparse)
 
+    return _frontier(mu, Sigma, K, frontier_weights)
+
+def top_k_weights(w_val: np.ndarray, K: int) -> np.ndarray:
+    """Post-traitement : garde les K plus gros actifs et renormalise."""
+    top_indices = np.argsort(-w_val)[:K]  # indices des K plus gros
+    w_sparse = np.zeros_like(w_val)
+    w_sparse[top_indices] = w_val[top_indices]
+    w_sparse /= w_sparse.sum()  # renormaliser pour que sum=1
+    return w_sparse
+
+def solve_point(problem: cp.Problem, w: cp.Variable, eps_param: cp.Parameter, eps: float, K: int) -> np.ndarray | None:
+    """Résout le problème compilé pour un epsilon et renvoie les poids à K actifs ; None si aucune solution."""
+    eps_param.value = eps
+    problem.solve(solver=cp.SCS, verbose=False, warm_start=True)
+
+    if problem.status not in ["optimal", "optimal_inaccurate"]:
+        return None
+
+    # ----------------------------
+    # Post-traitement : sélectionner les K plus gros actifs
+    # ----------------------------
+    return top_k_weights(w.value, K)
+
+def optimize_adaptive(mu: np.ndarray, Sigma: np.ndarray, K: int, lambda_penalty: float, n_points: int = 20,
+                      tol: float = 1e-3, factor: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Frontière sur une grille d'epsilons adaptative (voir level2.functions.adaptive_epsilons), entre la
+    variance minimale long-only et la variance du portefeuille de rendement maximal.
+    """
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+
+    w_min = cp.Variable(mu.shape[0])
+    cp.Problem(cp.Minimize(risk_expression(w_min, Sigma)), [cp.sum(w_min) == 1, w_min >= 0]).solve(solver=cp.CLARABEL)
+    eps_min = float(w_min.value @ Sigma @ w_min.value) * (1 + 1e-6)
+    best = np.argmax(mu)
+    eps_max = float(covariance_diag(Sigma)[best])
+
+    problem, w, eps_param, penalty_param = build_problem(mu, Sigma, factor=factor)
+    penalty_param.value = lambda_penalty
+    points = adaptive_epsilons(lambda eps: solve_point(problem, w, eps_param, eps, K), eps_min, eps_max, mu, Sigma,
+                               n_points=n_points, tol=tol)
+
+    return _frontier(mu, Sigma, K, [w_val for _, w_val in points])
+
+def _frontier(mu, Sigma, K, frontier_weights):
     frontier_weights = np.array([w for w in frontier_weights if nb_not_null_weights(w, 1e-4) == K])
 
     frontier_yields = np.array([f_yield(w, mu) for w in frontier_weights])
     frontier_volatility = np.array([f_volatility(w, Sigma) for w in frontier_weights])
 
-    return frontier_yields, frontier_volatility, frontier_weights
\ No newline at end of file
+    return frontier_yields, frontier_volatility, frontier_weights
+
+# ---- Balayage 2-D (epsilon x lambda_penalty) en parallèle ---- #
+# Problème compilé une fois par worker
+sweep_problem_global = None
+
+def init_sweep_worker(mu, Sigma, K, factor):
+    global sweep_problem_global
+    problem, w, eps_param, penalty_param = build_problem(mu, Sigma, factor=factor)
+    sweep_problem_global = (mu, Sigma, K, problem, w, eps_param, penalty_param)
+
+def sweep_column(eps, lambda_penalties, patience):
+    """
+    Résout une colonne epsilon fixé le long de l'axe des pénalités ; s'arrête dès que le support top-K
+    est resté identique pendant patience pénalités consécutives.
+    """
+    mu, Sigma, K, problem, w, eps_param, penalty_param = sweep_problem_global
+    rows = []
+    previous_support = None
+    unchanged = 0
+
+    for lambda_penalty in lambda_penalties:
+        penalty_param.value = lambda_penalty
+        w_sparse = solve_point(problem, w, eps_param, eps, K)
+        if w_sparse is None:
+            rows.append({'epsilon': eps, 'lambda_penalty': lambda_penalty, 'status': problem.status})
+            previous_support, unchanged = None, 0
+            continue
+
+        support = tuple(int(i) for i in np.flatnonzero(w_sparse > 1e-4))
+        unchanged = unchanged + 1 if support == previous_support else 0
+        previous_support = support
+        rows.append({'epsilon': eps, 'lambda_penalty': lambda_penalty, 'status': problem.status,
+                     'return': f_yield(w_sparse, mu), 'volatility': f_volatility(w_sparse, Sigma),
+                     'n_assets': len(support), 'support': support, 'weights': w_sparse})
+
+        if unchanged >= patience:
+            break
+
+    return rows
+
+def sweep(mu: np.ndarray, Sigma: np.ndarray, K: int, epsilons: np.ndarray, lambda_penalties: np.ndarray,
+          max_workers: int = 8, patience: int = 2, factor: bool = False) -> pd.DataFrame:
+    """
+    Grille (epsilon, lambda_penalty) : une colonne par epsilon, réparties sur un pool de processus.
+
+    Le long de l'axe des pénalités (dans l'ordre donné), une colonne s'arrête dès que le support choisi
+    par le post-traitement top-K ne change plus (voir sweep_column) : les points restants ne sont pas
+    calculés et n'apparaissent pas dans le tableau. Renvoie un DataFrame à une ligne par point résolu.
+    """
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+    lambda_penalties = list(lambda_penalties)
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=init_sweep_worker,
+        initargs=(mu, Sigma, K, factor)
+    ) as executor:
+        columns = executor.map(sweep_column, epsilons, [lambda_penalties] * len(epsilons),
+                               [patience] * len(epsilons))
+        rows = [row for column in columns for row in column]
+
+    columns = ['epsilon', 'lambda_penalty', 'status', 'return', 'volatility', 'n_assets', 'support', 'weights']
+    return pd.DataFrame(rows, columns=columns)
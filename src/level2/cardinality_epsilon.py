@@ -3,15 +3,22 @@ from itertools import combinations
 from tqdm import tqdm
 import math
 import pandas as pd
+import time
 import cvxpy as cp
 import numpy as np
+from pyscipopt import Model, quicksum
 
-from level2.functions import nb_not_null_weights
-from portfolio_utils import f_volatility, f_yield
+from level2.functions import nb_not_null_weights, sigma_factor, adaptive_epsilons, risk_expression
+from portfolio_utils import f_volatility, f_yield, FactorCovariance, as_covariance, covariance_diag
 
 
-def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
-
+def build_problem(mu: np.ndarray, Sigma: np.ndarray, K: int, factor: bool = False):
+    """
+    Construit une seule fois le problème ε-contraint (DPP), epsilon étant un cp.Parameter.
+    Avec factor=True, le risque s'écrit ||L^T w||^2 <= epsilon (Cholesky de Sigma) au lieu de quad_form ;
+    Sigma peut aussi être une FactorCovariance (voir level2.functions.risk_expression).
+    Renvoie (problem, w, eps).
+    """
     n = mu.shape[0]
 
     # ----------------------------
@@ -19,37 +26,227 @@ def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray) -
     # ----------------------------
     w = cp.Variable(n)  # pondérations du portefeuille
     z = cp.Variable(n, boolean=True)  # variables binaires pour la cardinalité
+    eps = cp.Parameter(nonneg=True)  # borne de risque
+
+    risk = risk_expression(w, Sigma, factor=factor)
+
+    # ----------------------------
+    # Problème ε-contraint
+    # ----------------------------
+    objective = cp.Minimize(-mu @ w)  # Minimiser F1 = -w^T mu (maximiser le rendement)
+
+    constraints = [
+        cp.sum(w) == 1,  # Somme des poids = 1
+        w >= 0,  # Long-only (à adapter)
+        w <= z,  # Lie w et z (si z=0 => w=0)
+        cp.sum(z) <= K,  # Cardinalité
+        risk <= eps,  # Risque F2 <= epsilon
+    ]
+
+    return cp.Problem(objective, constraints), w, eps
+
+
+def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray, factor: bool = False) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+
+    # Problème compilé une fois, résolu pour chaque epsilon avec démarrage à chaud
+    problem, w, eps_param = build_problem(mu, Sigma, K, factor=factor)
 
     # Résultats stockés
     frontier_weights = []
 
     for eps in epsilons:
+        w_val = solve_point(problem, w, eps_param, eps)
+        if w_val is None:
+            print(f"Pas de solution pour epsilon = {eps}")
+            continue
+
+        # Stockage des solutions
+        frontier_weights.append(w_val)
 
-        # ----------------------------
-        # Problème ε-contraint
-        # ----------------------------
-        objective = cp.Minimize(-mu @ w)  # Minimiser F1 = -w^T mu (maximiser le rendement)
+    return _frontier(mu, Sigma, K, frontier_weights)
 
-        constraints = [
-            cp.sum(w) == 1,  # Somme des poids = 1
-            w >= 0,  # Long-only (à adapter)
-            w <= z,  # Lie w et z (si z=0 => w=0)
-            cp.sum(z) <= K,  # Cardinalité
-            cp.quad_form(w, Sigma) <= eps,  # Risque F2 <= epsilon
-        ]
 
-        problem = cp.Problem(objective, constraints)
-        problem.solve(solver=cp.SCIP, verbose=False)
+def solve_point(problem: cp.Problem, w: cp.Variable, eps_param: cp.Parameter, eps: float) -> np.ndarray | None:
+    """Résout le problème compilé pour un epsilon ; None si aucune solution."""
+    eps_param.value = eps
+    problem.solve(solver=cp.SCIP, verbose=False, warm_start=True)
 
-        if problem.status not in ["optimal", "optimal_inaccurate"]:
+    if problem.status not in ["optimal", "optimal_inaccurate"]:
+        return None
+    return w.value
+
+
+def min_variance_portfolio(mu: np.ndarray, Sigma: np.ndarray, K: int) -> np.ndarray:
+    """Portefeuille de variance minimale à au plus K actifs (MIQP)."""
+    n = mu.shape[0]
+    w = cp.Variable(n)
+    z = cp.Variable(n, boolean=True)
+    problem = cp.Problem(cp.Minimize(risk_expression(w, Sigma)),
+                         [cp.sum(w) == 1, w >= 0, w <= z, cp.sum(z) <= K])
+    problem.solve(solver=cp.SCIP, verbose=False)
+    return w.value
+
+
+def optimize_adaptive(mu: np.ndarray, Sigma: np.ndarray, K: int, n_points: int = 20, tol: float = 1e-3,
+                      factor: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Frontière ε-contrainte sur une grille d'epsilons adaptative (voir level2.functions.adaptive_epsilons).
+
+    La plage réalisable va de la variance du portefeuille de variance minimale à K actifs à celle du
+    portefeuille de rendement maximal : aucun MIQP n'est résolu hors de cette plage.
+    """
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+
+    w_min = min_variance_portfolio(mu, Sigma, K)
+    eps_min = float(w_min @ Sigma @ w_min) * (1 + 1e-6)
+    best = np.argmax(mu)
+    eps_max = float(covariance_diag(Sigma)[best])
+
+    problem, w, eps_param = build_problem(mu, Sigma, K, factor=factor)
+    points = adaptive_epsilons(lambda eps: solve_point(problem, w, eps_param, eps), eps_min, eps_max, mu, Sigma,
+                               n_points=n_points, tol=tol)
+
+    return _frontier(mu, Sigma, K, [w_val for _, w_val in points])
+
+
+def _frontier(mu, Sigma, K, frontier_weights):
+    frontier_weights = np.array([w for w in frontier_weights if nb_not_null_weights(w, 1e-4) == K])
+
+    frontier_yields = np.array([f_yield(w, mu) for w in frontier_weights])
+    frontier_volatility = np.array([f_volatility(w, Sigma) for w in frontier_weights])
+
+    return frontier_yields, frontier_volatility, frontier_weights
+
+
+def perspective_diagonal(Sigma: np.ndarray, shrink: float = 0.99) -> np.ndarray:
+    """
+    Diagonale delta telle que Sigma - diag(delta) reste semi-définie positive :
+    delta_i = shrink * lambda_min(R) * Sigma_ii, R étant la matrice de corrélation.
+    """
+    d = np.sqrt(np.diag(Sigma))
+    corr_min = np.linalg.eigvalsh(Sigma / np.outer(d, d))[0]
+    return shrink * max(corr_min, 0.0) * np.diag(Sigma)
+
+
+def _scip_quadratic(model, model_vars, Q: np.ndarray = None, L: np.ndarray = None):
+    """
+    w^T Q w écrit ||L^T w||^2 avec des variables auxiliaires y = L^T w (forme conique, Q = L L^T).
+    Renvoie (expression, y, L) : y et L servent à compléter une solution initiale.
+    """
+    L = sigma_factor(Q) if L is None else L
+    y = [model.addVar(f"y_{k}", lb=None) for k in range(L.shape[1])]
+    for k in range(L.shape[1]):
+        model.addCons(quicksum(L[i, k] * model_vars[i] for i in range(len(model_vars)) if L[i, k] != 0) == y[k])
+    return quicksum(y_k * y_k for y_k in y), y, L
+
+
+def build_scip_model(mu: np.ndarray, Sigma: np.ndarray, K: int, formulation: str = "standard"):
+    """
+    Modèle SCIP (pyscipopt) du problème ε-contraint, construit une fois pour tout le balayage.
+
+    formulation="perspective" : Sigma = (Sigma - diag(delta)) + diag(delta) et la partie diagonale est
+    reformulée en perspective (w_i^2 <= s_i z_i), ce qui renforce la relaxation continue ; le big-M de
+    w_i <= z_i est de plus resserré à chaque epsilon (delta_i w_i^2 <= epsilon).
+
+    Avec une FactorCovariance, seules k variables auxiliaires sont créées (y = G^T w) et la partie
+    idiosyncratique diag(D) sert directement de diagonale pour la perspective.
+    """
+    n = mu.shape[0]
+    Sigma = as_covariance(Sigma)
+    is_factor = isinstance(Sigma, FactorCovariance)
+
+    model = Model()
+    model.hideOutput()
+
+    w = [model.addVar(f"w_{i}", lb=0.0, ub=1.0) for i in range(n)]
+    z = [model.addVar(f"z_{i}", vtype="B") for i in range(n)]
+
+    model.addCons(quicksum(w) == 1)
+    link = [model.addCons(w[i] - z[i] <= 0, name=f"link_{i}") for i in range(n)]
+    model.addCons(quicksum(z) <= K)
+
+    delta = np.zeros(n)
+    s = []
+    if formulation == "perspective":
+        delta = Sigma.D if is_factor else perspective_diagonal(Sigma)
+        s = [model.addVar(f"s_{i}", lb=0.0) for i in range(n)]
+        for i in range(n):
+            model.addCons(w[i] * w[i] - s[i] * z[i] <= 0, name=f"perspective_{i}")
+        common, y, L = _scip_quadratic(model, w, L=Sigma.loadings()) if is_factor else _scip_quadratic(model, w, Sigma - np.diag(delta))
+        risk_expr = common + quicksum(delta[i] * s[i] for i in range(n))
+    elif formulation == "standard":
+        if is_factor:
+            common, y, L = _scip_quadratic(model, w, L=Sigma.loadings())
+            risk_expr = common + quicksum(Sigma.D[i] * w[i] * w[i] for i in range(n))
+        else:
+            risk_expr, y, L = _scip_quadratic(model, w, Sigma)
+    else:
+        raise ValueError(f"Formulation inconnue : {formulation}")
+
+    risk = model.addCons(risk_expr <= 1.0, name="risk")
+    model.setObjective(-quicksum(mu[i] * w[i] for i in range(n)))
+
+    return model, w, z, s, risk, link, delta, y, L
+
+
+def optimize_scip(mu: np.ndarray, Sigma: np.ndarray, K: int, epsilons: np.ndarray, formulation: str = "standard",
+                  warm_start: bool = True) -> tuple[np.ndarray, np.ndarray, np.ndarray, pd.DataFrame]:
+    """
+    Balayage ε-contraint directement avec SCIP, sur un modèle construit une fois.
+
+    Avec warm_start, quand epsilon augmente, la solution précédente reste réalisable : elle est complétée
+    (variables auxiliaires y = L^T w et s = w^2 de la perspective), vérifiée puis fournie comme solution
+    initiale, et son objectif sert alors de borne (objlimit). Renvoie aussi un DataFrame des statistiques
+    par epsilon (statut, noeuds de branch-and-bound, temps, solution initiale proposée / acceptée).
+    """
+    mu = np.asarray(mu, dtype=float)
+    model, w, z, s, risk, link, delta, y, L = build_scip_model(mu, Sigma, K, formulation=formulation)
+
+    frontier_weights = []
+    stats = []
+    previous = None  # (epsilon, objectif, valeurs de w, valeurs de z)
+
+    for eps in epsilons:
+        model.freeTransform()
+        model.chgRhs(risk, float(eps))
+        if formulation == "perspective":
+            upper = np.minimum(1.0, np.sqrt(eps / np.maximum(delta, 1e-12)))
+            for i in range(len(w)):
+                model.chgCoefLinear(link[i], z[i], -float(upper[i]))
+
+        hinted = warm_start and previous is not None and eps >= previous[0]
+        accepted = False
+        if hinted:
+            _, prev_obj, w_prev, z_prev = previous
+            sol = model.createSol()
+            for var, val in zip(w + z + s + y, np.concatenate([w_prev, z_prev, w_prev[:len(s)] ** 2, L.T @ w_prev])):
+                model.setSolVal(sol, var, val)
+            # En phase PROBLEM, addSol stocke la solution sans la vérifier (et renvoie False pour un doublon
+            # déjà conservé après freeTransform) : la réalisabilité est donc contrôlée avec checkSol
+            accepted = model.checkSol(sol, printreason=False, original=True)
+            if accepted:
+                model.addSol(sol)
+            else:
+                model.freeSol(sol)
+        model.setObjlimit(prev_obj + 1e-9 if accepted else model.infinity())
+
+        start = time.perf_counter()
+        model.optimize()
+        elapsed = time.perf_counter() - start
+
+        status = model.getStatus()
+        objective = model.getObjVal() if model.getNSols() > 0 and status == "optimal" else np.nan
+        stats.append({'epsilon': eps, 'status': status, 'nodes': model.getNNodes(), 'time': elapsed,
+                      'objective': objective, 'warm_start': hinted, 'warm_start_accepted': accepted})
+
+        if status != "optimal":
             print(f"Pas de solution pour epsilon = {eps}")
             continue
 
-        # Stockage des solutions
-        w_val = w.value
-        ret_val = f_yield(w_val, mu)
-        risk_val = f_volatility(w_val, Sigma)
-
+        w_val = np.array([model.getVal(var) for var in w])
+        z_val = np.round([model.getVal(var) for var in z])
+        previous = (eps, objective, w_val, z_val)
         frontier_weights.append(w_val)
 
     frontier_weights = np.array([w for w in frontier_weights if nb_not_null_weights(w, 1e-4) == K])
@@ -57,4 +254,4 @@ def optimize(mu: np.ndarray, Sigma: np.ndarray,  K: int, epsilons: np.ndarray) -
     frontier_yields = np.array([f_yield(w, mu) for w in frontier_weights])
     frontier_volatility = np.array([f_volatility(w, Sigma) for w in frontier_weights])
 
-    return frontier_yields, frontier_volatility, frontier_weights
\ No newline at end of file
+    return frontier_yields, frontier_volatility, frontier_weights, pd.DataFrame(stats)
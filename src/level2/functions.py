@@ -1,18 +1,141 @@
+import heapq
+import os
+import pickle
+import time
 import numpy as np
 import pandas as pd
 from pymoo.algorithms.moo.nsga2 import NSGA2
-from pymoo.optimize import minimize
 from pymoo.termination import get_termination
-from pymoo.core.problem import ElementwiseProblem
+from pymoo.core.problem import Problem, ElementwiseProblem
 from pymoo.core.repair import Repair
+from pymoo.core.termination import Termination, TerminateIfAny
+from pymoo.core.callback import Callback
+from pymoo.indicators.hv import HV
+
+import cvxpy as cp
 
 from portfolio_utils import f_yield, f_volatility, f_cost, load_datas, f_returns_on_df, f_mu_on_df, f_sigma_on_df
+from portfolio_utils import FactorCovariance, as_covariance, covariance_diag, f_instability
+from level1.functions import optimize_portfolio_batched
+from result_cache import cached, fingerprint
 
 def nb_not_null_weights(weights: np.ndarray, threshold: float = 1e-6) -> int:
     """Compte le nombre de poids non nuls dans un vecteur de poids."""
     return np.sum(weights > threshold)
 
-class PortfolioNSGA2(ElementwiseProblem):
+def sigma_factor(Sigma: np.ndarray) -> np.ndarray:
+    """Facteur L tel que Sigma = L L^T (Cholesky, ou racine spectrale si Sigma n'est que semi-définie)."""
+    Sigma = np.asarray(Sigma, dtype=float)
+    try:
+        return np.linalg.cholesky(Sigma)
+    except np.linalg.LinAlgError:
+        eigval, eigvec = np.linalg.eigh(Sigma)
+        return eigvec * np.sqrt(np.clip(eigval, 0.0, None))
+
+def risk_expression(w: cp.Variable, Sigma, factor: bool = False) -> cp.Expression:
+    """
+    Variance w^T Sigma w en expression cvxpy. Une FactorCovariance s'écrit ||G^T w||^2 + sum D_i w_i^2
+    (k + n termes, sans matrice n x n) ; factor=True utilise ||L^T w||^2 (Cholesky) pour une Sigma dense.
+    """
+    if isinstance(Sigma, FactorCovariance):
+        return cp.sum_squares(Sigma.loadings().T @ w) + cp.sum_squares(cp.multiply(np.sqrt(Sigma.D), w))
+    return cp.sum_squares(sigma_factor(Sigma).T @ w) if factor else cp.quad_form(w, Sigma)
+
+def adaptive_epsilons(solve_point, eps_min: float, eps_max: float, mu: np.ndarray, Sigma: np.ndarray,
+                      n_points: int = 20, tol: float = 1e-3) -> list[tuple[float, np.ndarray]]:
+    """
+    Placement adaptatif des epsilons d'une frontière ε-contrainte.
+
+    Résout les deux bornes [eps_min, eps_max] puis coupe en deux, récursivement, le segment dont les
+    extrémités sont les plus éloignées dans le plan (rendement, volatilité) normalisé, jusqu'à épuiser
+    le budget n_points ou jusqu'à ce que tous les écarts soient inférieurs à tol.
+    solve_point(eps) renvoie les poids optimaux ou None. Renvoie la liste triée des (epsilon, poids).
+    """
+    solved = {}
+
+    def point(eps):
+        w = solve_point(eps)
+        solved[eps] = w
+        return None if w is None else np.array([f_yield(w, mu), f_volatility(w, Sigma)])
+
+    low, high = point(eps_min), point(eps_max)
+    if low is None or high is None:
+        return sorted(((e, w) for e, w in solved.items() if w is not None), key=lambda x: x[0])
+
+    scale = np.maximum(np.abs(high - low), 1e-12)
+
+    def distance(a, b):
+        return float(np.linalg.norm((a - b) / scale))
+
+    # Tas des segments, le plus long d'abord
+    segments = [(-distance(low, high), eps_min, eps_max, low, high)]
+    while len(solved) < n_points and segments:
+        neg_dist, e_left, e_right, p_left, p_right = heapq.heappop(segments)
+        if -neg_dist < tol:
+            break
+        e_mid = (e_left + e_right) / 2
+        p_mid = point(e_mid)
+        if p_mid is None:
+            continue
+        heapq.heappush(segments, (-distance(p_left, p_mid), e_left, e_mid, p_left, p_mid))
+        heapq.heappush(segments, (-distance(p_mid, p_right), e_mid, e_right, p_mid, p_right))
+
+    return sorted(((e, w) for e, w in solved.items() if w is not None), key=lambda x: x[0])
+
+class PortfolioNSGA2(Problem):
+    """
+    Problème NSGA-II (rendement, volatilité, coût) évalué pour toute la population en un seul appel
+    (sans le coût par individu de l'évaluateur pymoo), avec des résultats identiques bit à bit à
+    PortfolioNSGA2Elementwise : mêmes fronts à graine fixe.
+
+    year_moments : (mu par année (Y x n), Sigma par année (Y x n x n)), par exemple issus de
+    portfolio_utils.f_year_moments. S'il est fourni, un 4e objectif minimise l'instabilité inter-annuelle
+    yield_std_per * std(rendements annuels) + vol_std_per * std(volatilités annuelles), évaluée pour
+    toute la population en une contraction batchée (instability_weights = (yield_std_per, vol_std_per)).
+    """
+
+    def __init__(self, mu, Sigma, w0, K, delta_tol, c=0.01, year_moments=None, instability_weights=(0.7, 0.3)):
+        self.mu = np.asarray(mu, dtype=float)
+        self.Sigma = as_covariance(Sigma)
+        self.w0 = np.asarray(w0, dtype=float)
+        self.delta_tol = delta_tol
+        self.K = K
+        self.c = c
+        self.year_moments = year_moments
+        self.instability_weights = instability_weights
+        n_assets = len(mu)
+
+        super().__init__(n_var=n_assets,
+                         n_obj=3 if year_moments is None else 4,
+                         n_ieq_constr=0,
+                         n_eq_constr=2,            # contrainte : somme = 1
+                         xl=0.0,
+                         xu=1.0)
+
+    def _evaluate(self, X, out, *args, **kwargs):
+        # X : population, shape (n_individuals, n_assets)
+        # Rendement et volatilité ligne par ligne, avec les mêmes appels que f_yield / f_volatility : X @ mu ou
+        # X @ Sigma (gemv/gemm) accumulent dans un autre ordre que dot, et NSGA-II amplifie ces écarts de ~1e-17
+        # en fronts différents. Le reste (coûts, contraintes) est identique bit à bit en une seule opération.
+        f1 = -np.array([f_yield(w, self.mu) for w in X])                    # minimiser → rendement max
+        f2 = np.array([f_volatility(w, self.Sigma) for w in X])             # minimiser volatilité
+        f3 = self.c * np.sum(np.abs(X - self.w0), axis=1)                   # minimiser coût
+        objectives = [f1, f2, f3]
+
+        if self.year_moments is not None:
+            std_yields, std_vols = f_instability(X, *self.year_moments)
+            yield_std_per, vol_std_per = self.instability_weights
+            objectives.append(yield_std_per * std_yields + vol_std_per * std_vols)  # minimiser instabilité
+
+        # Contrainte égalité : somme(w) = 1
+        h1 = np.sum(X, axis=1) - 1
+        h2 = np.sum(X > self.delta_tol, axis=1) - self.K
+
+        out["F"] = np.column_stack(objectives)
+        out["H"] = np.column_stack([h1, h2])
+
+class PortfolioNSGA2Elementwise(ElementwiseProblem):
+    """Version individu par individu de PortfolioNSGA2 (formulation d'origine, sans 4e objectif)."""
 
     def __init__(self, mu, Sigma, w0, K, delta_tol, c=0.01):
         self.mu = mu
@@ -50,49 +173,253 @@ class CardinalityRepair(Repair):
 
     def _do(self, problem, X, **kwargs):
         # X : population, shape (n_individuals, n_assets)
-        X = X.copy()
-
-        for i in range(X.shape[0]):
-            w = X[i]
-
-            # Trouver les indices des K plus grands poids
-            idx = np.argsort(-w)[:self.K]
-
-            # Tout mettre à zéro
-            w_new = np.zeros_like(w)
-
-            # Garder seulement les K actifs
-            w_new[idx] = w[idx]
+        K = min(self.K, X.shape[1])
 
-            # Renormaliser pour somme=1
-            s = np.sum(w_new)
-            if s > 0:
-                w_new /= s
+        # Indices des K plus grands poids de chaque ligne (sans tri complet)
+        idx = np.argpartition(-X, K - 1, axis=1)[:, :K]
 
-            X[i] = w_new
+        # Garder seulement les K actifs
+        X_new = np.zeros_like(X)
+        np.put_along_axis(X_new, idx, np.take_along_axis(X, idx, axis=1), axis=1)
 
-        return X
+        # Renormaliser pour somme=1
+        s = X_new.sum(axis=1, keepdims=True)
+        return np.divide(X_new, s, out=X_new, where=s > 0)
 
 
-def optimize(mu: pd.Series, Sigma: pd.Series, w0: np.ndarray, K: int, delta_tol, population_size: int = 100, generations: int = 200, c:float=0.01) -> tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+def warm_start_population(mu, Sigma, w0: np.ndarray, K: int, population_size: int, previous_weights: np.ndarray = None,
+                          markowitz_lambdas: np.ndarray = None, seed: int = 42) -> np.ndarray:
+    """
+    Population initiale construite à partir de portefeuilles connus : la frontier_weights d'un run précédent,
+    la frontière de Markowitz (level1) sur markowitz_lambdas et w0, tous ramenés à K actifs par
+    CardinalityRepair. Le reste de la population est tiré au hasard (comme l'échantillonnage par défaut).
+    """
+    num_assets = len(mu)
+    rng = np.random.default_rng(seed)
+
+    seeds = [np.atleast_2d(np.asarray(w0, dtype=float))]
+    if previous_weights is not None and len(previous_weights) > 0:
+        seeds.append(np.atleast_2d(np.asarray(previous_weights, dtype=float)))
+    if markowitz_lambdas is not None:
+        _, _, markowitz_weights = optimize_portfolio_batched(markowitz_lambdas, mu, Sigma)
+        seeds.append(np.array(markowitz_weights))
+
+    X = np.vstack(seeds)
+    X = X[X.sum(axis=1) > 0]
+    X = np.unique(CardinalityRepair(K)._do(None, X), axis=0)
+
+    # Trop de graines : sous-échantillon régulier pour garder de la diversité
+    if len(X) > population_size:
+        X = X[np.linspace(0, len(X) - 1, population_size).astype(int)]
+
+    random_fill = CardinalityRepair(K)._do(None, rng.random((population_size - len(X), num_assets)))
+    return np.vstack([X, random_fill])
+
+
+def objective_bounds(mu, Sigma, w0: np.ndarray, c: float = 0.01, year_moments=None,
+                     instability_weights=(0.7, 0.3)) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Bornes fixes (idéal, nadir) des objectifs NSGA-II sur le simplexe, pour normaliser les fronts
+    de façon comparable d'une génération à l'autre : -rendement dans [-max mu, -min mu], volatilité
+    dans [0, max sigma_i] et coût dans [0, c (1 + sum|w0|)]. Avec year_moments, l'instabilité est
+    majorée par yield_std_per * max_i std_y(mu_i) + vol_std_per * max sigma_{y,i} / 2.
+    """
+    mu = np.asarray(mu, dtype=float)
+    max_vol = np.sqrt(np.max(covariance_diag(Sigma)))
+    max_cost = c * (1.0 + np.sum(np.abs(w0)))
+    ideal, nadir = np.array([-mu.max(), 0.0, 0.0]), np.array([-mu.min(), max_vol, max_cost])
+
+    if year_moments is not None:
+        mu_years, Sigma_years = year_moments
+        yield_std_per, vol_std_per = instability_weights
+        max_instability = (yield_std_per * np.max(np.std(mu_years, axis=0))
+                           + vol_std_per * np.sqrt(np.max(np.diagonal(Sigma_years, axis1=1, axis2=2))) / 2)
+        ideal, nadir = np.append(ideal, 0.0), np.append(nadir, max_instability)
+    return ideal, nadir
+
+def front_hypervolume(algorithm, ideal: np.ndarray, nadir: np.ndarray) -> float:
+    """Hypervolume (point de référence 1.1) du front réalisable courant, dans l'espace normalisé [ideal, nadir]."""
+    opt = algorithm.opt
+    if opt is None or len(opt) == 0:
+        return 0.0
+    F = opt.get("F")[opt.get("FEAS")[:, 0]]
+    if len(F) == 0:
+        return 0.0
+    F = (F - ideal) / np.maximum(nadir - ideal, 1e-12)
+    return float(HV(ref_point=np.full(F.shape[1], 1.1))(F))
+
+
+class HypervolumeTermination(Termination):
+    """
+    Arrêt sur stagnation de l'hypervolume : le calcul s'arrête dès que l'hypervolume du front n'a pas
+    progressé de plus de hv_tol (en relatif) sur les window dernières générations. Le test ne s'applique
+    qu'une fois un front réalisable trouvé (hypervolume > 0). n_max_gen et max_time (secondes) servent
+    de garde-fous.
+    """
+
+    def __init__(self, ideal: np.ndarray, nadir: np.ndarray, hv_tol: float = 1e-4, window: int = 20,
+                 n_max_gen: int = 1000, max_time: float = None):
+        super().__init__()
+        self.ideal = ideal
+        self.nadir = nadir
+        self.hv_tol = hv_tol
+        self.window = window
+        self.n_max_gen = n_max_gen
+        self.max_time = max_time
+        self.history = []
+        self.start_time = None
+        self.reason = None
+
+    def _update(self, algorithm):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        self.history.append(front_hypervolume(algorithm, self.ideal, self.nadir))
+
+        # Tant qu'aucun point réalisable n'existe, l'hypervolume reste nul : ce n'est pas une stagnation
+        if len(self.history) > self.window and self.history[-1] > 0:
+            previous, current = self.history[-1 - self.window], self.history[-1]
+            if current - previous <= self.hv_tol * current:
+                self.reason = "hypervolume"
+                return 1.0
+
+        progress = algorithm.n_gen / self.n_max_gen
+        if self.max_time is not None:
+            progress = max(progress, (time.perf_counter() - self.start_time) / self.max_time)
+        if progress >= 1.0:
+            self.reason = "n_gen" if algorithm.n_gen >= self.n_max_gen else "time"
+        return progress
+
+
+class GenerationLog(Callback):
+    """
+    Journal par génération : numéro, nombre d'évaluations, taille du front, hypervolume normalisé et
+    temps écoulé. Se consulte après le run avec to_frame().
+    """
+
+    def __init__(self, ideal: np.ndarray = None, nadir: np.ndarray = None):
+        super().__init__()
+        self.ideal = ideal
+        self.nadir = nadir
+        self.records = []
+        self.start_time = None
+
+    def initialize(self, algorithm):
+        self.start_time = time.perf_counter()
+        if self.ideal is None:
+            problem = algorithm.problem
+            self.ideal, self.nadir = objective_bounds(problem.mu, problem.Sigma, problem.w0, problem.c,
+                                                      getattr(problem, 'year_moments', None),
+                                                      getattr(problem, 'instability_weights', (0.7, 0.3)))
+
+    def notify(self, algorithm):
+        # Réutilise l'hypervolume déjà calculé par HypervolumeTermination s'il y en a un
+        termination = algorithm.termination
+        if isinstance(termination, HypervolumeTermination) and len(termination.history) == algorithm.n_gen:
+            hv = termination.history[-1]
+        else:
+            hv = front_hypervolume(algorithm, self.ideal, self.nadir)
+
+        self.records.append({
+            "n_gen": algorithm.n_gen,
+            "n_eval": algorithm.evaluator.n_eval,
+            "front_size": 0 if algorithm.opt is None else int(np.sum(algorithm.opt.get("FEAS"))),
+            "hypervolume": hv,
+            "elapsed": time.perf_counter() - self.start_time,
+        })
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records, columns=["n_gen", "n_eval", "front_size", "hypervolume", "elapsed"])
+
+
+def save_algorithm(algorithm, path: str, problem_key: str = None):
+    """
+    Sauvegarde atomique de l'état complet de l'algorithme (population, générateur aléatoire, terminaison),
+    accompagné de l'empreinte problem_key des paramètres du problème.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'problem_key': problem_key, 'algorithm': algorithm}, f)
+    os.replace(tmp_path, path)
+
+
+def load_algorithm(path: str, problem_key: str = None):
+    """Recharge un algorithme sauvegardé par save_algorithm ; erreur si le problème a changé depuis."""
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if not isinstance(state, dict) or state.get('problem_key') != problem_key:
+        raise ValueError(f"Checkpoint {path} ne correspond pas à ce problème (mu, Sigma, w0, K, delta_tol ou c différents)")
+    return state['algorithm']
+
+
+# Résultat déterministe (graine fixe) sauf arrêt au temps ; callbacks et checkpoints désactivent le cache
+@cached(ignore=("verbose",), bypass=("checkpoint_path", "callback", "max_time"))
+def optimize(mu: pd.Series, Sigma: pd.Series, w0: np.ndarray, K: int, delta_tol, population_size: int = 100, generations: int = 200, c:float=0.01, vectorized: bool = True,
+             initial_population: np.ndarray = None, checkpoint_path: str = None, checkpoint_every: int = 10,
+             hv_tol: float = None, window: int = 20, max_time: float = None, callback: Callback = None,
+             verbose: bool = False, year_moments=None, instability_weights=(0.7, 0.3)) -> tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+    """
+    Front NSGA-II (rendement, volatilité, coût) à exactement K actifs.
+
+    hv_tol : si renseigné, arrêt dès que l'hypervolume stagne sur window générations (voir
+    HypervolumeTermination), generations et max_time (secondes) restant des plafonds.
+    callback : par exemple un GenerationLog, pour suivre hypervolume, taille du front et temps par génération.
+    year_moments : ajoute l'instabilité inter-annuelle comme 4e objectif (voir PortfolioNSGA2) ;
+    la sortie garde le même format.
+
+    initial_population : population de départ (voir warm_start_population) au lieu d'un tirage aléatoire.
+    checkpoint_path : l'état de l'algorithme y est sauvegardé toutes les checkpoint_every générations ;
+    si le fichier existe déjà, le calcul reprend depuis cet état jusqu'à generations (ValueError si les
+    paramètres du problème diffèrent de ceux du checkpoint).
+    """
 
     if delta_tol > 1.0 / K:
         raise ValueError("delta_tol must be less than or equal to 1/K")
 
-    problem = PortfolioNSGA2(mu, Sigma, w0, K, delta_tol=delta_tol, c=c)
-
-    algorithm = NSGA2(
-        pop_size=population_size,
-        repair=CardinalityRepair(K)
-    )
-
-    termination = get_termination("n_gen", generations)
-
-    res = minimize(problem,
-                   algorithm,
-                   termination,
-                   seed=42,
-                   verbose=True)
+    if vectorized:
+        problem = PortfolioNSGA2(mu, Sigma, w0, K, delta_tol=delta_tol, c=c, year_moments=year_moments,
+                                 instability_weights=instability_weights)
+    elif year_moments is not None:
+        raise ValueError("year_moments requires the vectorized problem")
+    else:
+        problem = PortfolioNSGA2Elementwise(mu, Sigma, w0, K, delta_tol=delta_tol, c=c)
+
+    if hv_tol is not None:
+        ideal, nadir = objective_bounds(mu, Sigma, w0, c, year_moments, instability_weights)
+        termination = HypervolumeTermination(ideal, nadir, hv_tol=hv_tol, window=window,
+                                             n_max_gen=generations, max_time=max_time)
+    elif max_time is not None:
+        termination = TerminateIfAny(get_termination("n_gen", generations), get_termination("time", max_time))
+    else:
+        termination = get_termination("n_gen", generations)
+
+    # L'algorithme sauvegardé embarque son problème : reprendre avec d'autres paramètres est refusé
+    problem_key = None if checkpoint_path is None else fingerprint(
+        mu, Sigma, w0, K, delta_tol, c, vectorized, population_size, year_moments, instability_weights)
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        algorithm = load_algorithm(checkpoint_path, problem_key)
+        algorithm.termination = termination  # permet aussi de prolonger un run terminé
+        if callback is not None:
+            algorithm.callback = callback
+    else:
+        algorithm = NSGA2(
+            pop_size=population_size,
+            repair=CardinalityRepair(K),
+            **({} if initial_population is None else {'sampling': initial_population})
+        )
+
+        algorithm.setup(problem,
+                        termination=termination,
+                        seed=42,
+                        verbose=verbose,
+                        **({} if callback is None else {'callback': callback}))
+
+    while algorithm.has_next():
+        algorithm.next()
+        if checkpoint_path is not None and algorithm.n_gen % checkpoint_every == 0:
+            save_algorithm(algorithm, checkpoint_path, problem_key)
+
+    res = algorithm.result()
 
     frontier_weights = res.X
     frontier_weights = np.array([w for w in frontier_weights if nb_not_null_weights(w, 1e-4) == K])
@@ -0,0 +1,223 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+import time
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+
+from portfolio_utils import (f_yield, f_volatility, FactorCovariance, as_covariance, load_sector_map,
+                             non_dominated_indices)
+from level1.functions import optimize_portfolio_batched
+from level2.functions import nb_not_null_weights
+from level2 import cardinality_epsilon
+from level2.cardinality_BF import optimize_subsets_batched
+
+
+def sector_budgets(shares: pd.Series, K: int, sizes: pd.Series) -> pd.Series:
+    """
+    Répartit le budget de cardinalité K entre secteurs au prorata de shares (méthode du plus fort reste),
+    sans dépasser la taille de chaque secteur.
+    """
+    shares = shares.reindex(sizes.index).fillna(0.0).clip(lower=0.0)
+    shares = shares / shares.sum() if shares.sum() > 0 else pd.Series(1.0 / len(sizes), index=sizes.index)
+
+    quotas = K * shares
+    budgets = np.floor(quotas).astype(int).clip(upper=sizes)
+    remainders = (quotas - budgets).sort_values(ascending=False, kind="stable")
+
+    while budgets.sum() < min(K, sizes.sum()):
+        for sector in remainders.index:
+            if budgets.sum() >= K:
+                break
+            if budgets[sector] < sizes[sector]:
+                budgets[sector] += 1
+    return budgets
+
+
+def reference_shares(mu: np.ndarray, Sigma, sectors: pd.Series, num_lambdas: int = 20) -> pd.Series:
+    """Poids moyen de chaque secteur le long de la frontière de Markowitz sans cardinalité (level1)."""
+    _, _, weights = optimize_portfolio_batched(np.linspace(0.05, 1.0, num_lambdas), mu, Sigma)
+    return pd.Series(np.mean(weights, axis=0), index=sectors.index).groupby(sectors.values).sum()
+
+
+def solve_sector(mu: np.ndarray, Sigma: np.ndarray, k: int, n_points: int, solver: str) -> np.ndarray:
+    """
+    Frontière d'un secteur à exactement k actifs (poids sur les actifs du secteur).
+    solver="miqp" : ε-contrainte adaptative ; solver="bf" : énumération des C(n_s, k) sous-ensembles.
+    """
+    if k >= len(mu):
+        _, _, weights = optimize_portfolio_batched(np.linspace(0.05, 1.0, n_points), mu, Sigma)
+        return np.array(weights)
+
+    if solver == "miqp":
+        _, _, weights = cardinality_epsilon.optimize_adaptive(mu, Sigma, k, n_points=n_points)
+        return weights
+
+    if solver == "bf":
+        subsets = np.array(list(combinations(range(len(mu)), k)))
+        lambdas = np.linspace(0.05, 1.0, n_points)
+        yields, volatility, weights_k = optimize_subsets_batched(
+            lambdas, mu[subsets], Sigma[subsets[:, :, None], subsets[:, None, :]])
+        weights = np.zeros(weights_k.shape[:2] + (len(mu),))
+        np.put_along_axis(weights, np.broadcast_to(subsets[:, None, :], weights_k.shape), weights_k, axis=2)
+        weights = weights.reshape(-1, len(mu))
+        keep = non_dominated_indices(yields.ravel(), volatility.ravel())
+        return weights[keep]
+
+    raise ValueError(f"Solveur inconnu : {solver}")
+
+
+def _solve_sector(args):
+    return solve_sector(*args)
+
+
+def build_blocks(mu, Sigma, K: int, sectors: pd.Series, shares: pd.Series = None, n_points: int = 10,
+                 solver: str = "miqp", max_workers: int = None) -> tuple[np.ndarray, np.ndarray, pd.Series]:
+    """
+    Blocs de construction : portefeuilles des frontières sectorielles à 1, ..., k_s actifs, résolues en parallèle.
+    Renvoie P (n x M, un bloc par colonne, somme 1), le secteur de chaque bloc et les budgets par secteur.
+    """
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+    sizes = sectors.value_counts()
+    if shares is None:
+        shares = reference_shares(mu, Sigma, sectors)
+    budgets = sector_budgets(shares, K, sizes)
+
+    # Une tâche par (secteur, k <= k_s) : le MIQP de tête peut ainsi utiliser moins que k_s actifs d'un secteur
+    tasks, task_sectors = [], []
+    members = {}
+    for sector, k_s in budgets[budgets > 0].items():
+        idx = np.flatnonzero(sectors.values == sector)
+        Sigma_s = Sigma.subset(idx).to_dense() if isinstance(Sigma, FactorCovariance) else Sigma[np.ix_(idx, idx)]
+        members[sector] = idx
+        for k in range(1, int(k_s) + 1):
+            tasks.append((mu[idx], Sigma_s, k, n_points, solver))
+            task_sectors.append(sector)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_solve_sector, tasks))
+
+    columns, block_sectors = [], []
+    for sector, weights in zip(task_sectors, results):
+        for w_s in weights:
+            block = np.zeros(len(mu))
+            block[members[sector]] = w_s
+            columns.append(block)
+            block_sectors.append(sector)
+
+    return np.column_stack(columns), np.array(block_sectors), budgets
+
+
+def _sectors(mu, tickers, sector_map: dict) -> pd.Series:
+    tickers = list(mu.index) if isinstance(mu, pd.Series) else list(tickers)
+    sector_map = load_sector_map() if sector_map is None else sector_map
+    return pd.Series([sector_map.get(t, "Other") for t in tickers], index=tickers)
+
+
+def build_problem(mu: np.ndarray, Sigma, K: int, sectors: pd.Series, shares: pd.Series = None, n_points: int = 10,
+                  solver: str = "miqp", max_workers: int = None):
+    """
+    MIQP de tête (DPP, epsilon en cp.Parameter) sur les M blocs sectoriels : au plus un bloc par secteur,
+    variance <= epsilon, rendement maximal. Renvoie (problem, P, x, eps).
+    """
+    P, block_sectors, _ = build_blocks(mu, Sigma, K, sectors, shares=shares, n_points=n_points,
+                                       solver=solver, max_workers=max_workers)
+    mu_B = P.T @ mu
+    Sigma_B = P.T @ (Sigma @ P)
+    Sigma_B = (Sigma_B + Sigma_B.T) / 2
+    M = P.shape[1]
+
+    x = cp.Variable(M)
+    y = cp.Variable(M, boolean=True)
+    eps = cp.Parameter(nonneg=True)
+    constraints = [cp.sum(x) == 1, x >= 0, x <= y, cp.quad_form(x, cp.psd_wrap(Sigma_B)) <= eps]
+    constraints += [cp.sum(y[block_sectors == sector]) <= 1 for sector in np.unique(block_sectors)]
+
+    return cp.Problem(cp.Minimize(-mu_B @ x), constraints), P, x, eps
+
+
+def solve_point(problem: cp.Problem, P: np.ndarray, x: cp.Variable, eps_param: cp.Parameter,
+                eps: float) -> np.ndarray | None:
+    """Résout le MIQP de tête pour un epsilon et renvoie les poids sur les n actifs (None si aucune solution)."""
+    eps_param.value = eps
+    problem.solve(solver=cp.SCIP, verbose=False, warm_start=True)
+
+    if problem.status not in ["optimal", "optimal_inaccurate"]:
+        return None
+    w = P @ np.clip(x.value, 0.0, None)
+    w = np.where(w > 1e-6, w, 0.0)
+    return w / w.sum()
+
+
+def optimize(mu, Sigma, K: int, epsilons: np.ndarray, sector_map: dict = None, tickers=None,
+             n_points: int = 10, solver: str = "miqp", max_workers: int = None,
+             shares: pd.Series = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Frontière ε-contrainte hiérarchique par secteur.
+
+    1. Le budget K est réparti entre secteurs (plus fort reste, au prorata des poids sectoriels de la
+       frontière de Markowitz sans cardinalité, ou de shares).
+    2. Chaque secteur résout ses frontières à au plus k_s actifs, en parallèle (MIQP ou force brute).
+    3. Un MIQP de tête alloue le capital entre ces portefeuilles sectoriels (au plus un par secteur) :
+       un portefeuille a donc au plus K actifs.
+
+    tickers (ou l'index de mu) et sector_map ({ticker: secteur}, tick.json par défaut) définissent les
+    secteurs. Même format de sortie que cardinality_epsilon.optimize.
+    """
+    sectors = _sectors(mu, tickers, sector_map)
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+    problem, P, x, eps_param = build_problem(mu, Sigma, K, sectors, shares=shares, n_points=n_points,
+                                             solver=solver, max_workers=max_workers)
+
+    frontier_weights = []
+    for eps in epsilons:
+        w = solve_point(problem, P, x, eps_param, eps)
+        if w is None:
+            print(f"Pas de solution pour epsilon = {eps}")
+            continue
+        frontier_weights.append(w)
+
+    frontier_weights = np.array(frontier_weights)
+    frontier_yields = np.array([f_yield(w, mu) for w in frontier_weights])
+    frontier_volatility = np.array([f_volatility(w, Sigma) for w in frontier_weights])
+
+    return frontier_yields, frontier_volatility, frontier_weights
+
+
+def compare_with_flat(mu, Sigma, K: int, epsilons: np.ndarray, sector_map: dict = None, tickers=None,
+                      n_points: int = 10, solver: str = "miqp", max_workers: int = None) -> pd.DataFrame:
+    """
+    Compare, epsilon par epsilon, la frontière hiérarchique au MIQP plat (cardinality_epsilon) sur les
+    mêmes données. Les temps totaux sont dans attrs['time_flat'] et attrs['time_hierarchical'].
+    """
+    sectors = _sectors(mu, tickers, sector_map)
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)
+
+    start = time.perf_counter()
+    problem, w, eps_param = cardinality_epsilon.build_problem(mu, Sigma, K)
+    flat = [cardinality_epsilon.solve_point(problem, w, eps_param, eps) for eps in epsilons]
+    time_flat = time.perf_counter() - start
+
+    start = time.perf_counter()
+    problem, P, x, eps_param = build_problem(mu, Sigma, K, sectors, n_points=n_points, solver=solver,
+                                             max_workers=max_workers)
+    hierarchical = [solve_point(problem, P, x, eps_param, eps) for eps in epsilons]
+    time_hierarchical = time.perf_counter() - start
+
+    rows = []
+    for eps, w_flat, w_hier in zip(epsilons, flat, hierarchical):
+        row = {'epsilon': eps}
+        for name, w_val in [('flat', w_flat), ('hierarchical', w_hier)]:
+            row[f'{name}_return'] = np.nan if w_val is None else f_yield(w_val, mu)
+            row[f'{name}_volatility'] = np.nan if w_val is None else f_volatility(w_val, Sigma)
+            row[f'{name}_n_assets'] = 0 if w_val is None else nb_not_null_weights(w_val, 1e-4)
+        rows.append(row)
+
+    comparison = pd.DataFrame(rows)
+    comparison['return_gap'] = comparison['flat_return'] - comparison['hierarchical_return']
+    comparison.attrs['time_flat'] = time_flat
+    comparison.attrs['time_hierarchical'] = time_hierarchical
+    return comparison
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pymoo.algorithms.moo.nsga2 import NSGA2
+from pymoo.core.population import Population
+from pymoo.termination import get_termination
+from pymoo.util.nds.non_dominated_sorting import NonDominatedSorting
+
+from level2.functions import PortfolioNSGA2, CardinalityRepair, nb_not_null_weights
+from portfolio_utils import f_yield, f_volatility, f_cost, as_covariance
+
+# ---- Problème partagé par les îles d'un même worker (évite de repickliser Sigma à chaque époque) ---- #
+problem_global = None
+
+def init_worker(mu, Sigma, w0, K, delta_tol, c):
+    global problem_global
+    problem_global = PortfolioNSGA2(mu, Sigma, w0, K, delta_tol=delta_tol, c=c)
+
+def run_island(algorithm, migrants, population_size, generations, seed):
+    """
+    Fait évoluer une île pendant generations générations. L'algorithme (population, générateur aléatoire,
+    compteurs) est conservé d'une époque à l'autre : seule la première époque initialise une population
+    aléatoire, ensuite chaque appel à next() est une vraie génération. Les migrants (slots, X) remplacent
+    les individus aux positions slots et sont les seuls à être évalués.
+    """
+    if algorithm is None:
+        algorithm = NSGA2(pop_size=population_size, repair=CardinalityRepair(problem_global.K))
+        # La boucle ci-dessous fixe le nombre de générations ; la terminaison n'est pas consultée
+        algorithm.setup(problem_global, termination=get_termination("n_gen", generations), seed=seed, verbose=False)
+    else:
+        algorithm.problem = problem_global
+        if migrants is not None:
+            slots, X = migrants
+            incoming = Population.new(X=X)
+            algorithm.evaluator.eval(problem_global, incoming, algorithm=algorithm)
+            pop = algorithm.pop
+            pop[slots] = incoming
+            # Rangs et distances de crowding recalculés pour la sélection par tournoi
+            algorithm.pop = algorithm.survival.do(problem_global, pop, n_survive=len(pop),
+                                                  random_state=algorithm.random_state, algorithm=algorithm)
+
+    for _ in range(generations):
+        algorithm.next()
+
+    pop = algorithm.pop
+    algorithm.problem = None  # le problème reste dans le worker, seul l'état de l'île est renvoyé
+    return algorithm, pop.get("X"), pop.get("F"), pop.get("CV")[:, 0]
+
+def elites(F, CV, n_migrants, rng) -> np.ndarray:
+    """Indices d'au plus n_migrants individus réalisables et non dominés d'une île."""
+    feasible = np.flatnonzero(CV <= 0)
+    candidates = feasible if feasible.size else np.arange(len(F))
+    front = candidates[NonDominatedSorting().do(F[candidates], only_non_dominated_front=True)]
+    return rng.choice(front, size=min(n_migrants, front.size), replace=False)
+
+def optimize_islands(mu: pd.Series, Sigma: pd.Series, w0: np.ndarray, K: int, delta_tol, n_islands: int = 4,
+                     population_size: int = 100, generations: int = 200, migration_interval: int = 20,
+                     n_migrants: int = 5, c: float = 0.01, max_workers: int = None,
+                     seed: int = 42) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    NSGA-II en modèle d'îles : n_islands populations indépendantes (graines différentes) évoluent dans
+    des processus séparés. Toutes les migration_interval générations, chaque île envoie n_migrants
+    individus non dominés à l'île suivante (anneau), où ils remplacent des individus hors du premier
+    front. À la fin, toutes les îles sont fusionnées en un seul front non dominé.
+    Même format de sortie que level2.functions.optimize.
+    """
+    if delta_tol > 1.0 / K:
+        raise ValueError("delta_tol must be less than or equal to 1/K")
+
+    mu = np.asarray(mu, dtype=float)
+    Sigma = as_covariance(Sigma)  # une FactorCovariance est transmise telle quelle aux workers (B, F, D picklés)
+    w0 = np.asarray(w0, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    algorithms = [None] * n_islands
+    migrants = [None] * n_islands
+    seeds = [seed + 1000 * island for island in range(n_islands)]
+    done = 0
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers or n_islands,
+        initializer=init_worker,
+        initargs=(mu, Sigma, w0, K, delta_tol, c)
+    ) as executor:
+
+        while done < generations:
+            n_gen = min(migration_interval, generations - done)
+            results = list(executor.map(run_island, algorithms, migrants, [population_size] * n_islands,
+                                        [n_gen] * n_islands, seeds))
+            done += n_gen
+
+            algorithms = [algorithm for algorithm, _, _, _ in results]
+            migrants = [None] * n_islands
+            if done >= generations or n_islands < 2:
+                continue
+
+            # Migration en anneau : île i -> île i + 1
+            for island, (_, X, F, CV) in enumerate(results):
+                target = (island + 1) % n_islands
+                incoming = X[elites(F, CV, n_migrants, rng)]
+
+                _, _, F_target, _ = results[target]
+                first_front = NonDominatedSorting().do(F_target, only_non_dominated_front=True)
+                replaceable = np.setdiff1d(np.arange(len(F_target)), first_front)
+                if replaceable.size == 0:
+                    replaceable = np.arange(len(F_target))
+                slots = rng.choice(replaceable, size=min(len(incoming), replaceable.size), replace=False)
+                migrants[target] = (slots, incoming[:len(slots)])
+
+    populations = [X for _, X, _, _ in results]
+
+    # Fusion de toutes les îles en un seul front non dominé
+    X = np.vstack(populations)
+    X = X[np.array([nb_not_null_weights(w, 1e-4) == K for w in X], dtype=bool)]
+    problem = PortfolioNSGA2(mu, Sigma, w0, K, delta_tol=delta_tol, c=c)
+    F = problem.evaluate(X, return_values_of=["F"])
+    front = NonDominatedSorting().do(F, only_non_dominated_front=True)
+    frontier_weights = np.unique(X[front], axis=0)
+
+    frontier_yields = np.array([f_yield(w, mu) for w in frontier_weights])
+    frontier_volatility = np.array([f_volatility(w, Sigma) for w in frontier_weights])
+    frontier_cost = np.array([f_cost(w0, w, c) for w in frontier_weights])
+
+    return frontier_yields, frontier_volatility, frontier_cost, frontier_weights
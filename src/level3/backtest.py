@@ -0,0 +1,155 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from portfolio_utils import f_returns_on_df, f_mu_on_df, f_sigma_on_df, share_array, attach_array
+from level1.functions import optimize_portfolio_batched
+from level2.functions import optimize as optimize_level2, warm_start_population
+
+# ---- Rendements partagés avec les workers (mémoire partagée, sans copie) ---- #
+returns_global = None
+shm_global = None
+
+
+def init_worker(returns_spec):
+    global returns_global, shm_global
+    shm_global, returns_global = attach_array(returns_spec)
+
+
+def walk_forward_windows(n_days: int, train_window: int = 252, holding: int = 21) -> list[tuple[int, int, int]]:
+    """Fenêtres (début apprentissage, rebalancement, fin de détention) en positions dans les rendements."""
+    return [(start - train_window, start, min(start + holding, n_days))
+            for start in range(train_window, n_days, holding)]
+
+
+def estimate_moments(returns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """mu et Sigma annualisés d'une fenêtre d'apprentissage (mêmes conventions que portfolio_utils)."""
+    returns = pd.DataFrame(returns)
+    return f_mu_on_df(returns).values, f_sigma_on_df(returns).values
+
+
+def holding_path(W: np.ndarray, relatives: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Trajectoire en achat-conservation de L portefeuilles (lignes de W) sur une période de détention,
+    en un produit matriciel : valeurs (H x L, base 1 au rebalancement) = cumprod(relatifs de prix) @ W^T.
+    Renvoie aussi les poids dérivés en fin de période (L x n).
+    """
+    growth = np.cumprod(relatives, axis=0)
+    values = growth @ W.T
+    drifted = W * growth[-1] / values[-1][:, None]
+    return values, drifted
+
+
+def worker_level1(window: tuple[int, int, int], lambdas: np.ndarray) -> np.ndarray:
+    train_start, rebalance, _ = window
+    mu, Sigma = estimate_moments(returns_global[train_start:rebalance])
+    _, _, weights = optimize_portfolio_batched(lambdas, mu, Sigma)
+    return np.array(weights)
+
+
+def performance_summary(values: pd.DataFrame, turnover: pd.DataFrame, periods: int = 252) -> pd.DataFrame:
+    """
+    Rendement et volatilité annualisés, Sharpe (taux nul), drawdown maximal et rotation moyenne par stratégie.
+
+    values contient une valeur par jour de détention (après le rendement du jour), la base 1 étant la
+    valeur avant le premier jour : N valeurs correspondent donc à N rendements (le premier est pris par
+    rapport à 1), et la durée annualisée est N / periods, cohérente avec log(valeur finale).
+    """
+    log_returns = np.log(values / values.shift(1, fill_value=1.0))
+    years = len(log_returns) / periods
+    annual_return = np.log(values.iloc[-1]) / years
+    annual_volatility = log_returns.std() * np.sqrt(periods)
+    return pd.DataFrame({
+        'return': annual_return,
+        'volatility': annual_volatility,
+        'sharpe': annual_return / annual_volatility,
+        'max_drawdown': (1 - values / values.cummax()).max(),
+        'turnover': turnover.mean(),
+    })
+
+
+def _walk(windows, weights, relatives, c) -> tuple[np.ndarray, np.ndarray]:
+    """Enchaîne les périodes : coût de rotation au rebalancement (depuis les poids dérivés), puis trajectoire."""
+    level = np.ones(weights[0].shape[0])
+    holdings = np.zeros_like(weights[0])  # départ en liquidités
+    paths, turnover = [], []
+    for (_, rebalance, hold_end), W in zip(windows, weights):
+        traded = np.sum(np.abs(W - holdings), axis=1)
+        level = level * (1 - c * traded)
+        values, holdings = holding_path(W, relatives[rebalance:hold_end])
+        paths.append(level * values)
+        level = paths[-1][-1]
+        turnover.append(traded)
+    return np.vstack(paths), np.array(turnover)
+
+
+def backtest_level1(df: pd.DataFrame, lambdas: np.ndarray, train_window: int = 252, holding: int = 21,
+                    c: float = 0.001, max_workers: int = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Backtest glissant de la frontière de Markowitz : à chaque rebalancement, mu et Sigma sont estimés sur
+    les train_window derniers jours et la frontière (un portefeuille par lambda, solveur batché de level1)
+    est détenue pendant holding jours. Les fenêtres sont indépendantes et résolues en parallèle ; seul
+    l'enchaînement des valeurs (coûts de rotation c * sum|w - w_dérivé|) est séquentiel.
+
+    Renvoie les valeurs quotidiennes (base 1, une colonne par lambda) et le résumé de performance.
+    """
+    returns = f_returns_on_df(df)
+    lambdas = np.asarray(lambdas, dtype=float)
+    windows = walk_forward_windows(len(returns), train_window, holding)
+
+    shm, spec = share_array(returns.values)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(spec,)) as executor:
+            weights = list(executor.map(worker_level1, windows, [lambdas] * len(windows)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    paths, turnover = _walk(windows, weights, np.exp(returns.values), c)
+    values = pd.DataFrame(paths, index=returns.index[train_window:], columns=lambdas)
+    turnover = pd.DataFrame(turnover, index=returns.index[[w[1] for w in windows]], columns=lambdas)
+    return values, performance_summary(values, turnover)
+
+
+def backtest_level2(df: pd.DataFrame, K: int, train_window: int = 252, holding: int = 21, c: float = 0.001,
+                    risk_aversion: float = 0.5, delta_tol: float = 0.01, population_size: int = 100,
+                    generations: int = 200, hv_tol: float = 1e-3) -> tuple[pd.DataFrame, pd.DataFrame, np.ndarray]:
+    """
+    Backtest glissant de NSGA-II (level2) : séquentiel, car chaque fenêtre part des poids dérivés de la
+    précédente (w0), ce qui fait payer la rotation via f_cost. Le front de la fenêtre précédente sert de
+    population initiale. Dans chaque front, le portefeuille retenu minimise
+    risk_aversion * volatilité - (1 - risk_aversion) * rendement + coût.
+
+    Renvoie les valeurs quotidiennes, le résumé de performance et les poids retenus à chaque rebalancement.
+    """
+    returns = f_returns_on_df(df)
+    relatives = np.exp(returns.values)
+    windows = walk_forward_windows(len(returns), train_window, holding)
+
+    holdings = np.zeros(returns.shape[1])
+    previous_front = None
+    chosen = []
+    for train_start, rebalance, hold_end in windows:
+        mu, Sigma = estimate_moments(returns.values[train_start:rebalance])
+        initial_population = None
+        if previous_front is not None:
+            initial_population = warm_start_population(mu, Sigma, holdings, K, population_size,
+                                                       previous_weights=previous_front)
+
+        yields, volatility, cost, front = optimize_level2(mu, Sigma, holdings, K, delta_tol,
+                                                          population_size=population_size, generations=generations,
+                                                          c=c, initial_population=initial_population, hv_tol=hv_tol)
+        if len(front) == 0:
+            w = holdings if holdings.sum() > 0 else np.full(len(mu), 1.0 / len(mu))
+        else:
+            w = front[np.argmin(risk_aversion * volatility - (1 - risk_aversion) * yields + cost)]
+            previous_front = front
+        chosen.append(w)
+
+        _, drifted = holding_path(w[None, :], relatives[rebalance:hold_end])
+        holdings = drifted[0]
+
+    paths, turnover = _walk(windows, [w[None, :] for w in chosen], relatives, c)
+    values = pd.DataFrame(paths, index=returns.index[train_window:], columns=['level2'])
+    turnover = pd.DataFrame(turnover, index=returns.index[[w[1] for w in windows]], columns=['level2'])
+    return values, performance_summary(values, turnover), np.array(chosen)
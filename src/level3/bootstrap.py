@@ -0,0 +1,129 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from portfolio_utils import share_array, attach_array, f_returns_on_df
+from level3.functions import PortfolioRobustness, normalize
+from result_cache import cached
+
+# ---- Rendements des portefeuilles partagés avec les workers (mémoire partagée, sans copie) ---- #
+portfolio_returns_global = None
+shm_global = None
+
+
+def init_worker(returns_spec):
+    global portfolio_returns_global, shm_global
+    shm_global, portfolio_returns_global = attach_array(returns_spec)
+
+
+def block_indices(T: int, length: int, block_size: float, rng: np.random.Generator,
+                  method: str = "stationary") -> np.ndarray:
+    """
+    Indices (length,) d'un échantillon bootstrap par blocs d'une série de T jours.
+    method="stationary" : blocs de longueur géométrique de moyenne block_size, circulaires (Politis-Romano) ;
+    method="moving" : blocs consécutifs de longueur fixe block_size (ramenée à T si la série est plus
+    courte) tirés uniformément.
+    """
+    if method == "stationary":
+        new_block = rng.random(length) < 1.0 / block_size
+        new_block[0] = True
+        block = np.cumsum(new_block) - 1
+        block_start = np.flatnonzero(new_block)
+        offset = np.arange(length) - block_start[block]
+        starts = rng.integers(0, T, size=block_start.size)
+        return (starts[block] + offset) % T
+
+    if method == "moving":
+        block_size = min(max(int(block_size), 1), T)
+        n_blocks = -(-length // block_size)
+        starts = rng.integers(0, T - block_size + 1, size=n_blocks)
+        return (starts[:, None] + np.arange(block_size)).ravel()[:length]
+
+    raise ValueError(f"Méthode de bootstrap inconnue : {method}")
+
+
+def worker_chunk(replicates: range, seed: int, sample_length: int, block_size: float, method: str,
+                 periods: int) -> tuple[np.ndarray, np.ndarray]:
+    """Rendements et volatilités annualisés (len(replicates) x P) ; le réplicat r utilise la graine (seed, r)."""
+    X = portfolio_returns_global
+    yields = np.empty((len(replicates), X.shape[1]))
+    volatility = np.empty((len(replicates), X.shape[1]))
+    for k, r in enumerate(replicates):
+        idx = block_indices(X.shape[0], sample_length, block_size, np.random.default_rng([seed, r]), method)
+        sample = X[idx]
+        yields[k] = sample.mean(axis=0) * periods
+        volatility[k] = sample.std(axis=0, ddof=1) * np.sqrt(periods)
+    return yields, volatility
+
+
+@cached(ignore=("chunk_size", "max_workers"))
+def bootstrap_metrics(returns: pd.DataFrame, W: np.ndarray, n_replicates: int = 2000, sample_length: int = 252,
+                      block_size: float = 20, method: str = "stationary", seed: int = 42, chunk_size: int = 100,
+                      max_workers: int = None, periods: int = 252) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rendement et volatilité annualisés de P portefeuilles (lignes de W) sur n_replicates échantillons
+    bootstrap par blocs de sample_length jours des rendements (T x n).
+
+    Les rendements des portefeuilles X @ W^T (T x P) sont calculés une fois puis partagés avec les
+    workers ; chaque réplicat ne coûte que O(sample_length x P) et n'est jamais conservé : seuls les
+    (n_replicates x P) indicateurs sont renvoyés. Le réplicat r dépend uniquement de (seed, r), donc
+    le résultat ne dépend ni de chunk_size ni du nombre de workers.
+    """
+    X = np.asarray(returns, dtype=float)
+    portfolio_returns = X @ np.atleast_2d(np.asarray(W, dtype=float)).T
+
+    shm, spec = share_array(portfolio_returns)
+    chunks = [range(start, min(start + chunk_size, n_replicates)) for start in range(0, n_replicates, chunk_size)]
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(spec,)) as executor:
+            results = list(executor.map(worker_chunk, chunks, [seed] * len(chunks), [sample_length] * len(chunks),
+                                        [block_size] * len(chunks), [method] * len(chunks), [periods] * len(chunks)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return np.vstack([y for y, _ in results]), np.vstack([v for _, v in results])
+
+
+def robustness_scores(yields: np.ndarray, volatility: np.ndarray, yield_std_per: float, vol_std_per: float,
+                      n_resamples: int = 500, alpha: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """
+    Scores de robustesse (même définition que PortfolioRobustness.compute_scores, sur les écarts-types
+    entre réplicats) avec intervalles de confiance : les réplicats sont eux-mêmes rééchantillonnés
+    n_resamples fois et les quantiles alpha/2, 1 - alpha/2 des scores obtenus forment l'intervalle.
+    """
+    def scores(std_y, std_v):
+        return 1 - (yield_std_per * normalize(std_y) + vol_std_per * normalize(std_v))
+
+    std_yields = yields.std(axis=0)
+    std_vols = volatility.std(axis=0)
+
+    # Rééchantillonnage par matrice de comptages (n_resamples x B) : moyennes et moments d'ordre 2 par produits matriciels
+    B = yields.shape[0]
+    counts = np.random.default_rng(seed).multinomial(B, np.full(B, 1.0 / B), size=n_resamples) / B
+
+    def resampled_std(x):
+        return np.sqrt(np.maximum(counts @ x ** 2 - (counts @ x) ** 2, 0.0))
+
+    resampled = np.array([scores(std_y, std_v) for std_y, std_v in zip(resampled_std(yields), resampled_std(volatility))])
+
+    return pd.DataFrame({
+        'std_yield': std_yields,
+        'std_vol': std_vols,
+        'score': scores(std_yields, std_vols),
+        'score_low': np.quantile(resampled, alpha / 2, axis=0),
+        'score_high': np.quantile(resampled, 1 - alpha / 2, axis=0),
+    })
+
+
+def frontier_robustness(robustness: PortfolioRobustness, yield_std_per: float, vol_std_per: float,
+                        n_replicates: int = 2000, block_size: float = 20, method: str = "stationary",
+                        seed: int = 42, max_workers: int = None, alpha: float = 0.05) -> pd.DataFrame:
+    """
+    Équivalent bootstrap de PortfolioRobustness.compute_scores : les ~10 années civiles sont remplacées
+    par n_replicates années (252 jours) rééchantillonnées par blocs, et chaque score a un intervalle de confiance.
+    """
+    yields, volatility = bootstrap_metrics(f_returns_on_df(robustness.df), np.vstack(list(robustness.frontier_weights)),
+                                           n_replicates=n_replicates, block_size=block_size, method=method,
+                                           seed=seed, max_workers=max_workers)
+    return robustness_scores(yields, volatility, yield_std_per, vol_std_per, alpha=alpha)
@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 
 from level2.functions import optimize
-from portfolio_utils import f_returns_on_df, f_mu_on_df, f_sigma_on_df, f_yield, f_volatility
+from portfolio_utils import f_returns_on_df, f_mu_on_df, f_sigma_on_df, f_year_moments, f_moments_over_years, f_instability
 
 
 class PortfolioRobustness:
@@ -17,7 +17,12 @@ class PortfolioRobustness:
         self.mu = f_mu_on_df(re)
         self.Sigma = f_sigma_on_df(re)
 
-    def optimize(self, population_size=300, generations=100):
+        self._year_moments = None
+        self._weights_index = None
+
+    def optimize(self, population_size=300, generations=100, robust_objective=False, instability_weights=(0.7, 0.3)):
+        """robust_objective : l'instabilité inter-annuelle devient un 4e objectif de NSGA-II (year_moments)."""
+        year_moments = self.year_moments[1:] if robust_objective else None
         self.frontier_yields, self.frontier_volatility, self.frontier_cost, self.frontier_weights = optimize(self.mu,
                                                                                                              self.Sigma,
                                                                                                              self.w0,
@@ -25,10 +30,21 @@ class PortfolioRobustness:
                                                                                                              delta_tol=self.delta_tol,
                                                                                                              population_size=population_size,
                                                                                                              generations=generations,
-                                                                                                             c=self.c)
+                                                                                                             c=self.c,
+                                                                                                             year_moments=year_moments,
+                                                                                                             instability_weights=instability_weights)
+        self._weights_index = None
 
     def skip_optimize(self, frontier_weights):
         self.frontier_weights = frontier_weights
+        self._weights_index = None
+
+    @property
+    def year_moments(self) -> tuple[list[int], np.ndarray, np.ndarray]:
+        """(années, mu par année, Sigma par année), calculés une seule fois : ils ne dépendent pas de w."""
+        if self._year_moments is None:
+            self._year_moments = f_year_moments(self.df)
+        return self._year_moments
 
     def boostrap_sample_df(self) -> dict[int, pd.DataFrame]:
         years = sorted(set(self.df.index.year))
@@ -39,48 +55,43 @@ class PortfolioRobustness:
         return bootstrapped_dfs
 
     def evaluate_portfolio_over_years(self, w):
-        year_params = {}
-        for year, b in self.boostrap_sample_df().items():
-            re_y = f_returns_on_df(b)
-            mu_y = f_mu_on_df(re_y)
-            Sigma_y = f_sigma_on_df(re_y)
-            year_params[year] = (mu_y, Sigma_y)
-
-        rets = []
-        vols = []
-        for mu_y, Sigma_y in year_params.values():
-            r = f_yield(w, mu_y)
-            v = f_volatility(w, Sigma_y)
-            rets.append(r)
-            vols.append(v)
-        return np.array(rets), np.array(vols)
+        _, mu_years, Sigma_years = self.year_moments
+        rets, vols = f_moments_over_years(w, mu_years, Sigma_years)
+        return rets[0], vols[0]
 
     def compute_scores(self, yield_std_per: float, vol_std_per: float):
         """
-        Calcule les scores de robustesse pour chaque portefeuille sur la frontière optimisée.
+        Calcule les scores de robustesse pour chaque portefeuille sur la frontière optimisée
+        (tous les portefeuilles et toutes les années en un seul calcul batché).
         """
-        self.std_yields = []
-        self.std_vols = []
-
-        for w in self.frontier_weights:
-            rets, vols = self.evaluate_portfolio_over_years(w)
-            self.std_yields.append(np.std(rets))  # f4 = instabilité rendement
-            self.std_vols.append(np.std(vols))
+        _, mu_years, Sigma_years = self.year_moments
+        # frontier_weights peut être un tableau d'objets (un vecteur par portefeuille) : empilement explicite
+        W = np.vstack(list(self.frontier_weights))
+        self.std_yields, self.std_vols = f_instability(W, mu_years, Sigma_years)  # f4 = instabilité rendement
 
         return 1 - (yield_std_per * normalize(self.std_yields) +  # instabilité rendement
                 vol_std_per * normalize(self.std_vols)  # instabilité risque
                 )
 
+    @staticmethod
+    def _weights_key(w) -> bytes:
+        # Arrondi à 1e-8 (bruit numérique) ; + 0.0 ramène -0.0 à 0.0, sinon les octets diffèrent
+        return (np.round(np.asarray(w, dtype=float), 8) + 0.0).tobytes()
+
+    def _frontier_index(self, w) -> int:
+        """Position de w dans la frontière (-1 si absent) : table de hachage des poids arrondis, en O(1)."""
+        if self._weights_index is None:
+            self._weights_index = {}
+            for i, weights in enumerate(self.frontier_weights):
+                self._weights_index.setdefault(self._weights_key(weights), i)
+
+        return self._weights_index.get(self._weights_key(w), -1)
+
     def compute_score(self, w, yield_std_per: float, vol_std_per: float):
         """
         Calcule le score de robustesse pour un portefeuille donné w.
         """
-        index = -1
-        for i, weights in enumerate(self.frontier_weights):
-            if np.allclose(weights, w):
-                index = i
-                break
-        if index == -1:
+        if self._frontier_index(w) == -1:
             raise ValueError("Le portefeuille donné n'est pas dans la frontière optimisée.")
         rets, vols = self.evaluate_portfolio_over_years(w)
         std_yield = np.std(rets)
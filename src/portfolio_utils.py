@@ -1,18 +1,124 @@
 import pandas as pd
 import numpy as np
 import os
+import json
+import hashlib
+from multiprocessing import shared_memory
 from pathlib import Path
 
 
-def load_datas() -> pd.DataFrame:
-    path = Path(__file__).resolve().parent.parent / 'datasets'
+DATASETS_PATH = Path(__file__).resolve().parent.parent / 'datasets'
+
+
+def _read_csvs(path: Path, how: str = 'inner') -> tuple[pd.DataFrame, dict]:
+    """
+    Lecture et jointure des CSV sectoriels (Information_Technology en premier) ; renvoie aussi {ticker: secteur}.
+    how='outer' garde toutes les dates, les prix absents valant NaN.
+    """
     df = pd.read_csv(path / 'Information_Technology.csv', index_col=0, parse_dates=True)
+    sector_map = {ticker: 'Information_Technology' for ticker in df.columns}
 
     for file in os.listdir(path):
         if file.endswith('.csv') and 'Information_Technology' not in file:
             temp_df = pd.read_csv(os.path.join(path, file), index_col=0, parse_dates=True)
-            df = df.join(temp_df, how='inner')
-    return df
+            sector_map.update({ticker: file[:-4] for ticker in temp_df.columns})
+            df = df.join(temp_df, how=how)
+    return df, sector_map
+
+
+def _file_hash(file: Path) -> str:
+    return hashlib.sha1(file.read_bytes()).hexdigest()
+
+
+def _store_is_valid(path: Path, cache: Path, meta: dict) -> bool:
+    """
+    Vrai si les CSV sources sont inchangés : mtime et taille identiques, ou à défaut même contenu (sha1),
+    auquel cas le nouveau mtime est enregistré pour éviter de rehacher au prochain chargement.
+    """
+    sources = meta.get('sources', {})
+    current = sorted(f for f in os.listdir(path) if f.endswith('.csv'))
+    if current != sorted(sources):
+        return False
+
+    touched = False
+    for file in current:
+        stat = (path / file).stat()
+        source = sources[file]
+        if stat.st_mtime_ns == source['mtime_ns'] and stat.st_size == source['size']:
+            continue
+        if _file_hash(path / file) != source['sha1']:
+            return False
+        source['mtime_ns'], source['size'] = stat.st_mtime_ns, stat.st_size
+        touched = True
+
+    if touched:
+        tmp_path = cache / f'meta.json.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, cache / 'meta.json')
+    return True
+
+
+def build_price_store(path: Path = DATASETS_PATH, how: str = 'inner') -> dict:
+    """
+    Convertit une fois les CSV de path en un magasin binaire path/.cache/<how> : prices.npy (matrice float64
+    tickers x dates, stockée par colonne de prix comme les blocs pandas issus des CSV), dates.npy et
+    meta.json (tickers, secteurs, empreinte des sources). meta.json est écrit en dernier et sert de
+    témoin de validité.
+    """
+    path = Path(path)
+    cache = path / '.cache' / how
+    cache.mkdir(parents=True, exist_ok=True)
+    df, sector_map = _read_csvs(path, how=how)
+
+    suffix = f'.{os.getpid()}.tmp'
+    with open(cache / f'prices.npy{suffix}', 'wb') as f:
+        np.save(f, np.ascontiguousarray(df.values.T, dtype=np.float64), allow_pickle=False)
+    with open(cache / f'dates.npy{suffix}', 'wb') as f:
+        np.save(f, df.index.values, allow_pickle=False)
+
+    sources = {}
+    for file in sorted(f for f in os.listdir(path) if f.endswith('.csv')):
+        stat = (path / file).stat()
+        sources[file] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': _file_hash(path / file)}
+    meta = {'tickers': list(df.columns), 'sectors': sector_map, 'index_name': df.index.name, 'sources': sources}
+    with open(cache / f'meta.json{suffix}', 'w') as f:
+        json.dump(meta, f)
+
+    for name in ['prices.npy', 'dates.npy', 'meta.json']:
+        os.replace(cache / f'{name}{suffix}', cache / name)
+    return meta
+
+
+def load_price_store(path: Path = DATASETS_PATH, how: str = 'inner',
+                     mmap_mode: str = 'r') -> tuple[np.ndarray, np.ndarray, dict]:
+    """
+    Prix (memory map en lecture seule, pages partagées entre processus ; mmap_mode='c' : copie à l'écriture),
+    dates et métadonnées du magasin binaire, reconstruit automatiquement si un CSV source a changé.
+    """
+    path = Path(path)
+    cache = path / '.cache' / how
+    try:
+        with open(cache / 'meta.json') as f:
+            meta = json.load(f)
+        if not _store_is_valid(path, cache, meta):
+            meta = build_price_store(path, how=how)
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        meta = build_price_store(path, how=how)
+
+    prices = np.load(cache / 'prices.npy', mmap_mode=mmap_mode)
+    dates = np.load(cache / 'dates.npy')
+    return prices, dates, meta
+
+
+def load_datas(use_cache: bool = True, how: str = 'inner') -> pd.DataFrame:
+    if not use_cache:
+        return _read_csvs(DATASETS_PATH, how=how)[0]
+
+    # Copie à l'écriture : pages partagées tant que le DataFrame n'est pas modifié, le fichier n'est jamais touché
+    prices, dates, meta = load_price_store(DATASETS_PATH, how=how, mmap_mode='c')
+    index = pd.DatetimeIndex(dates, name=meta['index_name'])
+    return pd.DataFrame(np.asarray(prices).T, index=index, columns=meta['tickers'], copy=False)
 
 def f_share_stats(df:pd.DataFrame, tick:str):
     returns = f_returns_on_df(df)
@@ -20,8 +126,10 @@ def f_share_stats(df:pd.DataFrame, tick:str):
     sigma = f_sigma_on_df(returns)
     return {'yield': mu[tick], 'volatility': np.sqrt(sigma.loc[tick, tick])}
 
-def f_returns_on_df(df:pd.DataFrame) -> pd.DataFrame:
-    return np.log(df / df.shift(1)).dropna()
+def f_returns_on_df(df:pd.DataFrame, dropna: bool = True) -> pd.DataFrame:
+    """Rendements logarithmiques ; dropna=False garde les jours incomplets (NaN), à utiliser avec f_sigma_masked."""
+    returns = np.log(df / df.shift(1))
+    return returns.dropna() if dropna else returns.iloc[1:]
 
 def f_mu_on_df(returns: pd.DataFrame) -> pd.Series:
     return returns.mean() * 252
@@ -29,15 +137,279 @@ def f_mu_on_df(returns: pd.DataFrame) -> pd.Series:
 def f_sigma_on_df(returns: pd.DataFrame) -> pd.DataFrame:
     return returns.cov() * 252
 
+class ReturnStatistics:
+    """
+    Moments des rendements logarithmiques tenus à jour de façon incrémentale (mises à jour de Welford
+    par paquets : moyenne et co-moments). Ajouter m jours coûte O(m n^2) au lieu de recalculer la
+    covariance sur tout l'historique. mu et Sigma correspondent à f_mu_on_df et f_sigma_on_df appliqués
+    aux mêmes prix (mêmes jours écartés par dropna).
+
+    window : si renseigné, seuls les window derniers rendements sont conservés (fenêtre glissante).
+    """
+
+    def __init__(self, prices: pd.DataFrame = None, window: int = None, periods: int = 252):
+        self.window = window
+        self.periods = periods
+        self.columns = None
+        self.last_prices = None
+        self.count = 0
+        self.mean = None
+        self.comoment = None
+        self.returns = None  # rendements de la fenêtre (si window)
+        if prices is not None:
+            self.append(prices)
+
+    def append(self, prices: pd.DataFrame):
+        """Ajoute de nouveaux jours de prix (lignes, mêmes tickers que lors du premier appel)."""
+        if self.columns is None:
+            self.columns = prices.columns
+            n = len(self.columns)
+            self.mean = np.zeros(n)
+            self.comoment = np.zeros((n, n))
+            self.returns = np.empty((0, n))
+        values = prices[self.columns].values.astype(float)
+
+        previous = values if self.last_prices is None else np.vstack([self.last_prices, values])
+        self.last_prices = values[-1:]
+        returns = np.log(previous[1:] / previous[:-1])
+        returns = returns[~np.isnan(returns).any(axis=1)]
+        if len(returns) == 0:
+            return
+
+        self._add(returns)
+        if self.window is not None:
+            self.returns = np.vstack([self.returns, returns])
+            excess = len(self.returns) - self.window
+            if excess > 0:
+                self._remove(self.returns[:excess])
+                self.returns = self.returns[excess:]
+
+    def _add(self, returns: np.ndarray):
+        m = len(returns)
+        batch_mean = returns.mean(axis=0)
+        centered = returns - batch_mean
+        total = self.count + m
+        delta = batch_mean - self.mean
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.count * m / total)
+        self.mean += delta * (m / total)
+        self.count = total
+
+    def _remove(self, returns: np.ndarray):
+        m = len(returns)
+        batch_mean = returns.mean(axis=0)
+        centered = returns - batch_mean
+        remaining = self.count - m
+        mean = (self.count * self.mean - m * batch_mean) / remaining
+        delta = batch_mean - mean
+        self.comoment -= centered.T @ centered + np.outer(delta, delta) * (remaining * m / self.count)
+        self.mean = mean
+        self.count = remaining
+
+    @property
+    def mu(self) -> pd.Series:
+        return pd.Series(self.mean * self.periods, index=self.columns)
+
+    @property
+    def Sigma(self) -> pd.DataFrame:
+        return pd.DataFrame(self.comoment / (self.count - 1) * self.periods, index=self.columns, columns=self.columns)
+
+def f_sigma_masked(returns: pd.DataFrame, min_periods: int = 2, psd_repair: bool = False,
+                   periods: int = 252) -> pd.DataFrame:
+    """
+    Covariance annualisée sur les observations disponibles par paire (comme returns.cov() avec NaN), par
+    produits matriciels : avec M le masque des valeurs présentes et X0 les rendements complétés par 0,
+    N = M^T M, S = X0^T M et cov = (X0^T X0 - S o S^T / N) / (N - 1).
+    Les paires avec moins de min_periods observations communes valent NaN. psd_repair projette le
+    résultat sur les matrices semi-définies positives (valeurs propres négatives ramenées à 0, NaN à 0).
+    """
+    X = returns.values.astype(float)
+    mask = ~np.isnan(X)
+    X0 = np.where(mask, X, 0.0)
+    M = mask.astype(float)
+
+    counts = M.T @ M
+    sums = X0.T @ M  # sums[i, j] : somme des x_i sur les jours où j est présent
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = (X0.T @ X0 - sums * sums.T / counts) / (counts - 1)
+    cov[counts < max(min_periods, 2)] = np.nan
+
+    if psd_repair:
+        cov = np.nan_to_num((cov + cov.T) / 2)
+        eigval, eigvec = np.linalg.eigh(cov)
+        cov = (eigvec * np.clip(eigval, 0.0, None)) @ eigvec.T
+
+    return pd.DataFrame(cov * periods, index=returns.columns, columns=returns.columns)
+
+def f_year_moments(df: pd.DataFrame) -> tuple[list[int], np.ndarray, np.ndarray]:
+    """
+    Moments annualisés de chaque année civile des prix df : (années, mu (Y x n), Sigma (Y x n x n)).
+    Chaque année est traitée comme un historique indépendant (f_returns_on_df sur la tranche).
+    """
+    years = sorted(set(df.index.year))
+    mus, sigmas = [], []
+    for y in years:
+        returns = f_returns_on_df(df[df.index.year == y])
+        mus.append(f_mu_on_df(returns).values)
+        sigmas.append(f_sigma_on_df(returns).values)
+    return years, np.array(mus), np.array(sigmas)
+
+def f_moments_over_years(W: np.ndarray, mu_years: np.ndarray, Sigma_years: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Rendements et volatilités (P x Y) de P portefeuilles (lignes de W) pour chacune des Y années, en une passe."""
+    W = np.atleast_2d(np.asarray(W, dtype=float))
+    yields = W @ mu_years.T
+    volatility = np.sqrt(np.maximum(np.einsum('ypj,pj->py', W[None] @ Sigma_years, W), 0.0))
+    return yields, volatility
+
+def f_instability(W: np.ndarray, mu_years: np.ndarray, Sigma_years: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Écarts-types inter-annuels du rendement et de la volatilité de chaque portefeuille (lignes de W)."""
+    yields, volatility = f_moments_over_years(W, mu_years, Sigma_years)
+    return np.std(yields, axis=1), np.std(volatility, axis=1)
+
 def f_yield(w, mu):
     return np.dot(w, mu)
 
 def f_volatility(w, Sigma):
+    if isinstance(Sigma, FactorCovariance):
+        return np.sqrt(Sigma.variance(w))
     return np.sqrt(np.dot(w, np.dot(Sigma, w)))
 
 def f_cost(w0, w, transaction_cost_rate:float=0.001):
     return transaction_cost_rate * np.sum(np.abs(w - w0))
 
+class FactorCovariance:
+    """
+    Covariance à facteurs Sigma = B F B^T + diag(D) (B : n x k expositions, F : k x k covariance des
+    facteurs, D : n variances idiosyncratiques). La matrice n x n n'est jamais formée : produits,
+    variances et sous-ensembles coûtent O(n k).
+
+    S'utilise comme une matrice dense avec @ (Sigma @ w, W @ Sigma) et avec f_volatility.
+    """
+
+    __array_ufunc__ = None  # W @ Sigma doit appeler __rmatmul__ plutôt que de convertir en tableau numpy
+
+    def __init__(self, B: np.ndarray, F: np.ndarray, D: np.ndarray, index=None):
+        self.B = np.asarray(B, dtype=float)
+        self.F = np.asarray(F, dtype=float)
+        self.D = np.asarray(D, dtype=float)
+        self.index = None if index is None else list(index)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.B.shape[0], self.B.shape[0]
+
+    def __matmul__(self, X):
+        X = np.asarray(X, dtype=float)
+        D = self.D if X.ndim == 1 else self.D[:, None]
+        return self.B @ (self.F @ (self.B.T @ X)) + D * X
+
+    def __rmatmul__(self, X):
+        X = np.asarray(X, dtype=float)
+        return ((X @ self.B) @ self.F) @ self.B.T + X * self.D
+
+    def variance(self, W) -> np.ndarray | float:
+        """w^T Sigma w pour un vecteur, ou pour chaque ligne d'une matrice de poids."""
+        W = np.asarray(W, dtype=float)
+        WB = W @ self.B
+        return np.einsum('...i,...i->...', WB @ self.F, WB) + (W ** 2) @ self.D
+
+    def diag(self) -> np.ndarray:
+        return np.einsum('ij,jk,ik->i', self.B, self.F, self.B) + self.D
+
+    def loadings(self) -> np.ndarray:
+        """Matrice n x k G = B L_F (L_F L_F^T = F), de sorte que Sigma = G G^T + diag(D)."""
+        eigval, eigvec = np.linalg.eigh(self.F)
+        return self.B @ (eigvec * np.sqrt(np.clip(eigval, 0.0, None)))
+
+    def norm2(self) -> float:
+        """Norme spectrale (majorant serré : ||G^T G||_2 + max D)."""
+        G = self.loadings()
+        return float(np.linalg.norm(G.T @ G, 2) + self.D.max())
+
+    def subset(self, idx) -> "FactorCovariance":
+        """Covariance restreinte aux actifs idx (indices entiers)."""
+        idx = np.asarray(idx)
+        index = None if self.index is None else [self.index[i] for i in idx]
+        return FactorCovariance(self.B[idx], self.F, self.D[idx], index=index)
+
+    def to_dense(self) -> np.ndarray:
+        return self.B @ self.F @ self.B.T + np.diag(self.D)
+
+    @classmethod
+    def from_pca(cls, returns: pd.DataFrame, k: int = 10, periods: int = 252) -> "FactorCovariance":
+        """k premières composantes principales des rendements (SVD des rendements centrés, sans former Sigma)."""
+        X = returns.values - returns.values.mean(axis=0)
+        X = X * np.sqrt(periods / (X.shape[0] - 1))
+        _, s, Vt = np.linalg.svd(X, full_matrices=False)
+        B = Vt[:k].T
+        F = np.diag(s[:k] ** 2)
+        D = np.maximum(np.sum(X ** 2, axis=0) - (B ** 2) @ np.diag(F), 1e-12)
+        return cls(B, F, D, index=returns.columns)
+
+    @classmethod
+    def from_sectors(cls, returns: pd.DataFrame, sector_map: dict = None, periods: int = 252) -> "FactorCovariance":
+        """
+        Un facteur par secteur (rendement équipondéré du secteur) ; chaque actif est exposé à son seul
+        secteur avec un bêta de régression. sector_map : {ticker: secteur}, load_sector_map() par défaut.
+        """
+        sector_map = load_sector_map() if sector_map is None else sector_map
+        sectors = pd.Series([sector_map.get(t, "Other") for t in returns.columns], index=returns.columns)
+        names = sorted(sectors.unique())
+
+        X = returns.values - returns.values.mean(axis=0)
+        factors = np.column_stack([X[:, (sectors == name).values].mean(axis=1) for name in names])
+        column = sectors.map({name: j for j, name in enumerate(names)}).values
+
+        f = factors[:, column]  # facteur de chaque actif
+        beta = np.sum(X * f, axis=0) / np.maximum(np.sum(f ** 2, axis=0), 1e-24)
+        B = np.zeros((X.shape[1], len(names)))
+        B[np.arange(X.shape[1]), column] = beta
+
+        scale = periods / (X.shape[0] - 1)
+        F = factors.T @ factors * scale
+        D = np.maximum(np.sum((X - beta * f) ** 2, axis=0) * scale, 1e-12)
+        return cls(B, F, D, index=returns.columns)
+
+def as_covariance(Sigma):
+    """Laisse une FactorCovariance telle quelle, convertit sinon en tableau numpy dense."""
+    return Sigma if isinstance(Sigma, FactorCovariance) else np.asarray(Sigma, dtype=float)
+
+def covariance_diag(Sigma) -> np.ndarray:
+    """Variances individuelles, pour une covariance dense ou à facteurs."""
+    return Sigma.diag() if isinstance(Sigma, FactorCovariance) else np.diag(np.asarray(Sigma, dtype=float))
+
+def load_sector_map(path: Path = None) -> dict:
+    """{ticker: secteur} d'après datasets/tick.json."""
+    path = Path(__file__).resolve().parent.parent / 'datasets' / 'tick.json' if path is None else Path(path)
+    with open(path) as f:
+        sectors = json.load(f)
+    return {ticker: sector for sector, tickers in sectors.items() for ticker in tickers}
+
+def non_dominated_indices(yields: np.ndarray, volatility: np.ndarray) -> np.ndarray:
+    """Indices des points non dominés (rendement max, volatilité min), triés par volatilité croissante."""
+    yields = np.asarray(yields, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    if yields.size == 0:
+        return np.array([], dtype=int)
+
+    # Tri par risque croissant (à risque égal, meilleur rendement d'abord)
+    idx = np.lexsort((-yields, volatility))
+    yield_sorted = yields[idx]
+    best_before = np.maximum.accumulate(np.concatenate([[-np.inf], yield_sorted[:-1]]))
+    return idx[yield_sorted > best_before]
+
+def share_array(arr: np.ndarray) -> tuple[shared_memory.SharedMemory, tuple]:
+    """Copie arr dans un segment de mémoire partagée. Renvoie le segment (à fermer/libérer) et sa description."""
+    arr = np.ascontiguousarray(arr, dtype=float)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+def attach_array(spec: tuple) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+    """Vue numpy (sans copie) sur un tableau créé par share_array dans un autre processus."""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name, track=False)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
 if __name__ == "__main__":
     df = load_datas()
     print(f_share_stats(df, "ANET"))
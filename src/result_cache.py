@@ -0,0 +1,207 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from portfolio_utils import DATASETS_PATH, FactorCovariance
+
+SOURCE_ROOT = Path(__file__).resolve().parent
+
+# Répertoire par défaut (ignoré par git avec le reste de datasets/.cache), surchargeable par variable d'environnement
+CACHE_DIR = Path(os.environ.get('PORTFOLIO_CACHE_DIR', DATASETS_PATH / '.cache' / 'results'))
+MAX_BYTES = int(os.environ.get('PORTFOLIO_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+
+def _update(h, obj):
+    """Alimente le hash h avec une représentation canonique de obj (contenu, pas identité)."""
+    if isinstance(obj, np.ndarray):
+        h.update(f'ndarray{obj.dtype.str}{obj.shape}'.encode())
+        h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else repr(obj.tolist()).encode())
+    elif isinstance(obj, pd.DataFrame):
+        h.update(b'DataFrame')
+        _update(h, obj.values)
+        _update(h, np.asarray(obj.index))
+        _update(h, np.asarray(obj.columns))
+    elif isinstance(obj, pd.Series):
+        h.update(b'Series')
+        _update(h, obj.values)
+        _update(h, np.asarray(obj.index))
+    elif isinstance(obj, FactorCovariance):
+        h.update(b'FactorCovariance')
+        for part in (obj.B, obj.F, obj.D):
+            _update(h, part)
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for key in sorted(obj, key=repr):
+            _update(h, key)
+            _update(h, obj[key])
+    elif isinstance(obj, (list, tuple, range)):
+        h.update(type(obj).__name__.encode())
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, (np.generic, int, float, bool, str, bytes, type(None))):
+        h.update(f'{type(obj).__name__}:{obj!r}'.encode())
+    elif callable(obj):
+        h.update(f'callable:{getattr(obj, "__module__", "")}.{getattr(obj, "__qualname__", repr(obj))}'.encode())
+    else:
+        raise TypeError(f"Type non pris en charge pour l'empreinte : {type(obj).__name__}")
+
+
+def fingerprint(*parts) -> str:
+    """Empreinte sha256 du contenu de parts (tableaux, objets pandas, FactorCovariance, conteneurs, scalaires)."""
+    h = hashlib.sha256()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+
+def _project_files(module_name: str) -> list[Path]:
+    """
+    Fichiers sources du projet dont dépend le module : lui-même puis, récursivement, les modules du projet
+    qu'il importe (modules importés ou objets importés, repérés par leur __module__). Les bibliothèques
+    externes et les modules non importés (interface Streamlit, tests...) sont exclus.
+    """
+    files = set()
+    stack = [sys.modules.get(module_name)]
+    while stack:
+        module = stack.pop()
+        path = getattr(module, '__file__', None)
+        if path is None:
+            continue
+        path = Path(path).resolve()
+        if path in files or not path.is_relative_to(SOURCE_ROOT) or not path.is_file():  # '<stdin>', notebooks...
+            continue
+        files.add(path)
+        for value in vars(module).values():
+            stack.append(value if isinstance(value, types.ModuleType)
+                         else sys.modules.get(getattr(value, '__module__', None) or ''))
+    return sorted(files)
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint(module_name: str) -> str:
+    """
+    Empreinte des sources dont dépend module_name (voir _project_files), calculée une fois par processus :
+    modifier un solveur ou un module qu'il utilise invalide ses résultats, une retouche de l'interface non.
+    """
+    h = hashlib.sha256()
+    for path in _project_files(module_name):
+        h.update(str(path.relative_to(SOURCE_ROOT)).encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache disque adressé par contenu : un fichier pickle par clé, partagé entre processus, sessions
+    Streamlit et notebooks. Écritures atomiques (fichier temporaire puis os.replace). Éviction LRU à la
+    taille : chaque lecture rafraîchit le mtime du fichier et, au-delà de max_bytes, les fichiers les
+    moins récemment utilisés sont supprimés.
+    """
+
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f'{key}.pkl'
+
+    def get(self, key: str) -> tuple[bool, object]:
+        path = self._path(key)
+        # Une éviction par un autre processus peut survenir entre la lecture et utime : simple défaut de cache
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, value
+
+    def set(self, key: str, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self) -> list[tuple[Path, int, float]]:
+        """(chemin, taille, dernier accès) de chaque entrée."""
+        entries = []
+        for path in self.directory.glob('*/*.pkl'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            path.unlink(missing_ok=True)
+
+
+def cache_enabled() -> bool:
+    return os.environ.get('PORTFOLIO_CACHE', '1') != '0'
+
+
+def cached(name: str = None, version: str = '1', ignore: tuple = (), bypass: tuple = (), cache: ResultCache = None):
+    """
+    Décorateur : le résultat de la fonction est mis en cache sur disque, la clé étant l'empreinte du nom
+    (module.fonction par défaut), de version, du code de la fonction et des sources dont elle dépend
+    (code_fingerprint) et de tous les arguments liés (valeurs par défaut incluses).
+    ignore : arguments sans effet sur le résultat (nombre de workers, taille de paquets...).
+    bypass : arguments qui, s'ils ne valent pas None, désactivent le cache (callbacks, checkpoints...).
+    PORTFOLIO_CACHE=0 désactive tous les caches. L'appel sans cache reste possible via fonction.__wrapped__.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        key_name = name or f'{func.__module__}.{func.__qualname__}'
+        # Source de la fonction elle-même : couvre aussi les fonctions définies dans un notebook ou un script
+        try:
+            source = inspect.getsource(func)
+        except (OSError, TypeError):
+            source = ''
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if not cache_enabled() or any(bound.arguments.get(arg) is not None for arg in bypass):
+                return func(*args, **kwargs)
+
+            arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+            key = fingerprint(key_name, version, source, code_fingerprint(func.__module__), arguments)
+            store = cache or ResultCache()
+
+            hit, value = store.get(key)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            store.set(key, value)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -1,7 +1,8 @@
 import numpy as np
 import streamlit as st
 from data.market_data import load_market_data
-from compute.frontier_markowitz import compute_markowitz_frontier
+from compute.frontier_markowitz import compute_markowitz_frontier, compute_markowitz_cla
+from streamlit_tools.app_utils import best_markowitz_portfolio
 from compute.frontier_level2 import compute_level2_frontier
 from level3.functions import PortfolioRobustness
 from plots.frontier_2d import plot_frontier_2d
@@ -51,12 +52,17 @@ portfolio_robustness = PortfolioRobustness(df_prices, w0, K_eff, 0, c=c if c is
 
 # Calcul des frontières selon le modèle
 if model == "Markowitz":
-    df_frontier = compute_markowitz_frontier(mu, sigma)
+    df_frontier = compute_markowitz_frontier(mu, sigma, engine=st.session_state["markowitz_engine"],
+                                             num_lambdas=int(st.session_state["lambda_count"]))
 else:
     df_frontier = compute_level2_frontier(mu, sigma, w0, K, c)
 
 valid = df_frontier[df_frontier["return"] >= r_min]
-best = valid.loc[valid["volatility"].idxmin()] if not valid.empty else None
+if model == "Markowitz":
+    # Frontière exacte : le portefeuille optimal pour r_min s'obtient sans nouvelle optimisation
+    best = best_markowitz_portfolio(compute_markowitz_cla(mu, sigma), r_min)
+else:
+    best = valid.loc[valid["volatility"].idxmin()] if not valid.empty else None
 
 has_solution = best is not None
 
@@ -65,9 +71,13 @@ col1, col2 = st.columns([2, 1])
 with col1:
     st.subheader("Frontière Efficiente")
 
-    # Si on a des poids dans valid, on peut faire un skip pour la robustesse
+    # Si on a des poids dans valid, on peut faire un skip pour la robustesse ; en Markowitz, best est
+    # interpolé sur la frontière exacte et doit y être ajouté pour pouvoir être noté
+    frontier_weights = [np.asarray(w, dtype=float) for w in valid["weights"]]
+    if model == "Markowitz" and has_solution:
+        frontier_weights.append(np.asarray(best["weights"], dtype=float))
     try:
-        portfolio_robustness.skip_optimize(valid["weights"].to_numpy())
+        portfolio_robustness.skip_optimize(np.array(frontier_weights))
     except Exception:
         pass
 
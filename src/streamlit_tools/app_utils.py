@@ -1,49 +1,41 @@
 import pandas as pd
 import numpy as np
-import os
-import glob
 import pickle
+from pathlib import Path
 from scipy.optimize import minimize
 
+from portfolio_utils import load_price_store
 from level1 import functions as level1
+from level1.critical_line import CriticalLineFrontier
 from level2 import functions as level2
 from level3 import functions as level3
 
 
-def get_ticker_sector_map(dataset_path="datasets"):
+def get_ticker_sector_map(dataset_path=None):
     """
-    Crée un dictionnaire {Ticker: Secteur} en scannant les noms de fichiers CSV.
+    Crée un dictionnaire {Ticker: Secteur} d'après les noms de fichiers CSV.
     Exemple: Si AAPL est dans 'Information_Technology.csv', alors map['AAPL'] = 'Information_Technology'
+    Le mapping est lu dans les métadonnées du magasin binaire des prix (voir portfolio_utils.load_price_store),
+    dans DATASETS_PATH par défaut (indépendant du répertoire de lancement). {} si les données sont introuvables.
     """
-    mapping = {}
-    # Adaptez le chemin si nécessaire selon où vous lancez le script
-    if not os.path.exists(dataset_path):
-        # Fallback si lancé depuis la racine ou src
-        if os.path.exists(os.path.join("..", dataset_path)):
-            dataset_path = os.path.join("..", dataset_path)
+    try:
+        _, _, meta = load_price_store() if dataset_path is None else load_price_store(Path(dataset_path))
+    except (OSError, ValueError):
+        return {}
+    return dict(meta['sectors'])
 
-    pattern = os.path.join(dataset_path, "*.csv")
-    files = glob.glob(pattern)
 
-    for file in files:
-        sector_name = os.path.basename(file).replace(".csv", "")
-        try:
-            # On lit juste la première ligne pour avoir les tickers (colonnes)
-            df = pd.read_csv(file, nrows=1, index_col=0)
-            tickers = df.columns.tolist()
-            for t in tickers:
-                mapping[t] = sector_name
-        except Exception as e:
-            print(f"Warning: Impossible de lire {file} pour le mapping secteur. {e}")
-
-    return mapping
-
-
-def calculate_markowitz_frontier(mu, Sigma, num_points=30):
+def calculate_markowitz_frontier(mu, Sigma, num_points=30, engine="sweep", num_lambdas=50):
     results = []
 
-    lambdas = np.linspace(0, 1, 50)
-    frontier_yields, frontier_volatility, frontier_weights = level1.optimize_portfolio(lambdas, mu, Sigma)
+    if engine == "cla":
+        frontier_yields, frontier_volatility, frontier_weights = CriticalLineFrontier(mu, Sigma).frontier(num_points)
+    elif engine == "batched":
+        lambdas = np.linspace(0, 1, num_lambdas)
+        frontier_yields, frontier_volatility, frontier_weights = level1.optimize_portfolio_batched(lambdas, mu, Sigma)
+    else:
+        lambdas = np.linspace(0, 1, num_lambdas)
+        frontier_yields, frontier_volatility, frontier_weights = level1.optimize_portfolio(lambdas, mu, Sigma, sweep=True)
 
     for r, v, w in zip(frontier_yields, frontier_volatility, frontier_weights):
         results.append({
@@ -55,6 +47,23 @@ def calculate_markowitz_frontier(mu, Sigma, num_points=30):
 
     return pd.DataFrame(results)
 
+def best_markowitz_portfolio(frontier: CriticalLineFrontier, r_min):
+    """
+    Portefeuille de volatilité minimale sous la contrainte rendement >= r_min, exact sur la frontière.
+    """
+    w = frontier.min_volatility_for_return(r_min)
+    if w is None:
+        return None
+
+    r = float(np.dot(w, frontier.mu))
+    v = float(np.sqrt(np.dot(w, frontier.Sigma @ w)))
+    return pd.Series({
+        'return': r,
+        'volatility': v,
+        'weights': w,
+        'sharpe': r / v if v > 0 else 0
+    })
+
 def calculate_portfolio(mu, Sigma, w0, K, c):
     results = []
 
@@ -1,7 +1,14 @@
 import streamlit as st
+from result_cache import fingerprint
 from streamlit_tools.app_utils import calculate_portfolio
 
 
-@st.cache_data
 def compute_level2_frontier(mu, sigma, w0, K, c):
-    return calculate_portfolio(mu, sigma, K=K, c=c, w0=w0)
+    # Cache mémoire du processus, clé : empreinte du contenu ; le cache disque est celui de level2.functions.optimize
+    return _level2_frontier(fingerprint(mu, sigma, w0, K, c), mu, sigma, w0, K, c)
+
+
+@st.cache_resource(max_entries=16)
+def _level2_frontier(key, _mu, _sigma, _w0, K, c):
+    # Les arguments préfixés par _ ne sont pas hachés par Streamlit : key les représente déjà
+    return calculate_portfolio(_mu, _sigma, K=K, c=c, w0=_w0)
@@ -1,7 +1,26 @@
 import streamlit as st
+from level1.critical_line import CriticalLineFrontier
+from result_cache import cached, fingerprint
 from streamlit_tools.app_utils import calculate_markowitz_frontier
 
 
-@st.cache_data
-def compute_markowitz_frontier(mu, sigma):
-    return calculate_markowitz_frontier(mu, sigma)
+def compute_markowitz_frontier(mu, sigma, engine="sweep", num_lambdas=50):
+    # Cache mémoire du processus devant le cache disque : un rerun ne relit ni ne dépickle rien
+    return _markowitz_frontier(fingerprint(mu, sigma, engine, num_lambdas), mu, sigma, engine, num_lambdas)
+
+
+@st.cache_resource(max_entries=16)
+def _markowitz_frontier(key, _mu, _sigma, engine, num_lambdas):
+    # Les arguments préfixés par _ ne sont pas hachés par Streamlit : key les représente déjà
+    return _markowitz_frontier_on_disk(_mu, _sigma, engine, num_lambdas)
+
+
+# Cache disque partagé entre sessions et notebooks (clé : contenu de mu/sigma, paramètres et code)
+@cached("streamlit.markowitz_frontier")
+def _markowitz_frontier_on_disk(mu, sigma, engine, num_lambdas):
+    return calculate_markowitz_frontier(mu, sigma, engine=engine, num_lambdas=num_lambdas)
+
+
+@st.cache_resource
+def compute_markowitz_cla(mu, sigma):
+    return CriticalLineFrontier(mu, sigma)
@@ -9,5 +9,5 @@ def load_market_data():
     returns = f_returns_on_df(df_prices)
     mu = f_mu_on_df(returns)
     sigma = f_sigma_on_df(returns)
-    sector_map = get_ticker_sector_map("datasets")
+    sector_map = get_ticker_sector_map()
     return df_prices, mu, sigma, sector_map
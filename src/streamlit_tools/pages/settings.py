@@ -9,6 +9,7 @@ def render_settings():
     st.session_state.setdefault("nsga_pop", 100)
     st.session_state.setdefault("nsga_gen", 200)
     st.session_state.setdefault("lambda_count", 50)
+    st.session_state.setdefault("markowitz_engine", "cla")
 
     col1, col2 = st.columns(2)
     with col1:
@@ -16,6 +17,8 @@ def render_settings():
         st.session_state["nsga_gen"] = st.number_input("Générations NSGA2", min_value=1, max_value=5000, step=1, value=int(st.session_state["nsga_gen"]))
     with col2:
         st.session_state["lambda_count"] = st.number_input("Nombre de lambda (linspace)", min_value=2, max_value=2000, step=1, value=int(st.session_state["lambda_count"]))
+        engines = ["cla", "batched", "sweep"]
+        st.session_state["markowitz_engine"] = st.selectbox("Moteur Markowitz (cla : frontière exacte, batched : tous les lambdas à la fois, sweep : SLSQP)", options=engines, index=engines.index(st.session_state["markowitz_engine"]))
         mutation = st.slider("Taux de mutation (optionnel)", min_value=0.0, max_value=1.0, value=0.05, step=0.01)
         st.session_state["nsga_mutation"] = mutation
 
@@ -12,4 +12,5 @@ def init_state():
     st.session_state.setdefault("nsga_pop", 100)
     st.session_state.setdefault("nsga_gen", 200)
     st.session_state.setdefault("lambda_count", 50)
+    st.session_state.setdefault("markowitz_engine", "cla")
     st.session_state.setdefault("nsga_mutation", 0.05)
@@ -0,0 +1,41 @@
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+os.environ['PORTFOLIO_CACHE'] = '0'  # compare de vrais runs, pas des résultats en cache
+
+from level2 import functions as level2
+
+
+class TestVectorizedNSGA2(unittest.TestCase):
+    """Le problème vectorisé doit donner exactement les fronts de la version élément par élément à graine fixe."""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        n = 40
+        returns = pd.DataFrame(rng.normal(0.0005, 0.01, (500, n)) @ (np.eye(n) + 0.2 * rng.normal(size=(n, n)) / np.sqrt(n)),
+                               columns=[f"A{i}" for i in range(n)])
+        cls.mu = returns.mean() * 252
+        cls.Sigma = returns.cov() * 252
+        cls.w0 = np.zeros(n)
+        cls.w0[0] = 0.001
+
+    def assertSameFronts(self, mu, Sigma):
+        kwargs = dict(K=5, delta_tol=0.01, population_size=60, generations=40, c=0.01)
+        elementwise = level2.optimize(mu, Sigma, self.w0, vectorized=False, **kwargs)
+        vectorized = level2.optimize(mu, Sigma, self.w0, vectorized=True, **kwargs)
+        for expected, found in zip(elementwise, vectorized):
+            np.testing.assert_array_equal(found, expected)
+
+    def test_same_fronts_numpy(self):
+        self.assertSameFronts(self.mu.values, self.Sigma.values)
+
+    def test_same_fronts_pandas(self):
+        self.assertSameFronts(self.mu, self.Sigma)
+
+
+if __name__ == "__main__":
+    unittest.main()